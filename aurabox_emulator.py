@@ -0,0 +1,254 @@
+"""
+Pretends to be an Aurabox, so that the display pipeline can be exercised (and benchmarked) without one.
+
+It takes frames the way AuraboxUI sends them (escaped and checksummed), checks them and reports every so often how
+many went through, how fast, how many were broken and, for frames carrying a timestamp, how long they took to arrive.
+
+    python aurabox_emulator.py tcp://127.0.0.1:7777
+    python aurabox_emulator.py unix:///tmp/aurabox.sock
+    python aurabox_emulator.py file:///tmp/aurabox.fifo
+
+Timestamped frames carry time.monotonic_ns() at the time they were sent, as the first 8 bytes (big endian) of their
+payload. Running with --bench does just that: it starts the emulator and loads it with frames through pysnakey's own
+transports, first back to back and then through the FrameEncoder and FrameSender used by AuraboxUI.
+
+    python aurabox_emulator.py tcp://127.0.0.1:7777 --bench 10000
+"""
+import os
+import re
+import sys
+import stat
+import time
+import socket
+import argparse
+import threading
+
+import pysnakey
+
+START, END, ESCAPE = 0x01, 0x02, 0x03
+IMAGE = 0x44
+
+# What comes after the length on an image frame: command, then 10x10 pixels, 4 bits each.
+IMAGE_HEADER = bytes([IMAGE, 0x00, 0x0A, 0x0A, 0x04])
+PAYLOAD_SIZE = 50
+
+ESCAPED = re.compile(b"\x03[\x04-\x06]")
+
+
+def encode_frame(payload):
+    """
+    Reference encoder, the straightforward way: length, command, payload and checksum, escaped and wrapped up.
+    """
+    body = IMAGE_HEADER + bytes(payload)
+    length = len(body) + 2
+    body = bytes([length & 0xFF, length >> 8]) + body
+    checksum = sum(body) & 0xFFFF
+    body += bytes([checksum & 0xFF, checksum >> 8])
+
+    escaped = bytearray([START])
+    for byte in body:
+        if byte in (START, END, ESCAPE):
+            escaped += bytes([ESCAPE, byte + 0x03])
+        else:
+            escaped.append(byte)
+    escaped.append(END)
+    return bytes(escaped)
+
+
+class Stats():
+    """
+    What the emulator has seen so far.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.bytes = 0
+        self.bad = 0
+        self.latencies = []
+        self.started = time.perf_counter()
+
+    def received(self, size, latency = None):
+        with self._lock:
+            self.frames += 1
+            self.bytes += size
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def broken(self):
+        with self._lock:
+            self.bad += 1
+
+    def summary(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            line = "frames {} ({:.1f}/s), {:.1f} kB/s, bad {}".format(
+                self.frames, self.frames / elapsed, self.bytes / elapsed / 1000, self.bad)
+
+            if self.latencies:
+                latencies = sorted(self.latencies)
+                percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))] / 1e6
+                line += ", latency p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms".format(
+                    percentile(0.5), percentile(0.99), latencies[-1] / 1e6)
+        return line
+
+
+class FrameParser():
+    """
+    Splits a stream of bytes into frames, checking each of them.
+    """
+    def __init__(self, stats, timestamps = False):
+        self._stats = stats
+        self._timestamps = timestamps
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        self._buffer += data
+        start = self._buffer.find(START)
+        while start != -1:
+            end = self._buffer.find(END, start + 1)
+            if end == -1:
+                break
+            self._check(bytes(self._buffer[start + 1:end]), end - start + 1)
+            start = self._buffer.find(START, end + 1)
+
+        # Keep whatever is left of an incomplete frame.
+        del self._buffer[:start if start != -1 else len(self._buffer)]
+
+    def _check(self, escaped, size):
+        body = ESCAPED.sub(lambda match: bytes([match.group()[1] - 0x03]), escaped)
+        if len(body) < 4:
+            return self._stats.broken()
+
+        length = body[0] | (body[1] << 8)
+        checksum = body[-2] | (body[-1] << 8)
+        if length != len(body) - 2 or checksum != (sum(body[:-2]) & 0xFFFF):
+            return self._stats.broken()
+
+        latency = None
+        payload = body[2 + len(IMAGE_HEADER):-2]
+        if self._timestamps and body[2] == IMAGE and len(payload) >= 8:
+            latency = time.monotonic_ns() - int.from_bytes(payload[:8], "big")
+        self._stats.received(size, latency)
+
+
+def serve(address, stats, timestamps = False, ready = None):
+    """
+    Takes frames from the given address, forever.
+    """
+    scheme, _, rest = address.partition("://")
+    if scheme == "file":
+        if ready is not None:
+            ready.set()
+        return _serve_file(rest, stats, timestamps)
+
+    if scheme == "tcp":
+        host, _, port = rest.rpartition(":")
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((host, int(port)))
+    elif scheme == "unix":
+        if os.path.exists(rest):
+            os.unlink(rest)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(rest)
+    else:
+        raise ValueError("Cannot emulate on address: {}".format(address))
+
+    server.listen()
+    if ready is not None:
+        ready.set()
+
+    # Senders reconnect whenever something goes wrong, so take them one after the other.
+    while True:
+        conn, _ = server.accept()
+        parser = FrameParser(stats, timestamps)
+        with conn:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    break
+                parser.feed(data)
+
+
+def _serve_file(path, stats, timestamps):
+    if not os.path.exists(path):
+        os.mkfifo(path)
+    is_pipe = stat.S_ISFIFO(os.stat(path).st_mode)
+
+    while True:
+        parser = FrameParser(stats, timestamps)
+        with open(path, "rb", buffering = 0) as stream:
+            while True:
+                data = stream.read(65536)
+                if data:
+                    parser.feed(data)
+                elif is_pipe:
+                    # The writer is gone. Wait for the next one.
+                    break
+                else:
+                    time.sleep(0.01)
+
+
+def bench(address, frames, batch):
+    stats = Stats()
+    ready = threading.Event()
+    threading.Thread(target = serve, args = (address, stats, True, ready), daemon = True).start()
+    ready.wait()
+
+    def payload(i):
+        return time.monotonic_ns().to_bytes(8, "big") + bytes([i & 0x77]) * (PAYLOAD_SIZE - 8)
+
+    def wait_for(count, timeout = 10):
+        deadline = time.perf_counter() + timeout
+        while stats.frames + stats.bad < count and time.perf_counter() < deadline:
+            time.sleep(0.001)
+
+    # Back to back, a batch of frames per write.
+    transport = pysnakey.Transport.for_address(address).connect()
+    start = time.perf_counter()
+    for i in range(0, frames, batch):
+        transport.send(*[encode_frame(payload(j)) for j in range(i, min(i + batch, frames))])
+    wait_for(frames)
+    elapsed = time.perf_counter() - start
+    transport.close()
+    print("raw:    {:.0f} frames/s sent, {}".format(frames / elapsed, stats.summary()))
+
+    # Through the sender, newest frame first.
+    sent_before = stats.frames
+    stats.latencies = []
+    sender = pysnakey.FrameSender(pysnakey.Transport.for_address(address).connect)
+    encoder = pysnakey.FrameEncoder(PAYLOAD_SIZE)
+    for i in range(frames):
+        sender.submit(encoder.encode(payload(i)))
+    time.sleep(0.1)
+    sender.close()
+    counters = sender.stats()
+    wait_for(sent_before + counters["sent"])
+    print("sender: sent {sent}, coalesced {coalesced}, dropped {dropped}, {summary}".format(summary = stats.summary(), **counters))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Aurabox emulator")
+    parser.add_argument("address", help = "tcp://host:port, unix:///path or file:///path")
+    parser.add_argument("--timestamps", action = "store_true", help = "frames carry the time they were sent")
+    parser.add_argument("--interval", type = float, default = 1.0, help = "seconds between reports")
+    parser.add_argument("--bench", type = int, metavar = "FRAMES", help = "send that many frames and report")
+    parser.add_argument("--batch", type = int, default = 16, help = "frames per write when benchmarking")
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        return bench(args.address, args.bench, args.batch)
+
+    stats = Stats()
+    threading.Thread(target = serve, args = (args.address, stats, args.timestamps), daemon = True).start()
+    try:
+        while True:
+            time.sleep(args.interval)
+            print(stats.summary())
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Benchmarks for the hot paths of pysnakey, from the default 10x10 space up to 2000x2000.
+
+    python benchmarks.py
+    python benchmarks.py --output before.json
+    python benchmarks.py --output after.json --compare before.json
+
+Results are kept as seconds per operation, so that runs from different commits can be compared one to one.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+# No need for an actual window to measure how long it takes to draw in one.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pysnakey
+
+GRID_SIZES = (10, 100, 500, 1000, 2000)
+SNAKE_LENGTHS = (10, 100, 1000, 10000, 100000)
+
+# How much slower than before counts as a regression when comparing.
+REGRESSION_THRESHOLD = 1.2
+
+
+def best_of(function, repeat = 3):
+    """
+    Returns the best time, in seconds, out of a few runs of the function.
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def quantum_for(cells):
+    """
+    Keeps windows around the default size, down to a pixel per cell.
+    """
+    return max(1, (pysnakey.SPACE_DIMENSIONS[0] - pysnakey.SPACE_BORDER_WIDTH * 2) // cells)
+
+
+def populated_space(cells, quantum = None, border_width = pysnakey.SPACE_BORDER_WIDTH, seed = 0):
+    """
+    Builds a square space with about a quarter of it taken by a snake and a few edibles around.
+    """
+    quantum = quantum or quantum_for(cells)
+    dimensions = (cells * quantum + border_width * 2,) * 2
+    space = pysnakey.Space(dimensions, quantum, border_width)
+    space.seed(seed)
+
+    snake = pysnakey.Snake([[0, 0]], pysnakey.KeyPress.DOWN)
+    for position in space.sample_unoccupied_positions(space.free_count // 4):
+        space.occupy(position, snake)
+    for position in space.sample_unoccupied_positions(max(1, space.free_count // 1000)):
+        space.occupy(position, pysnakey.Edible(position))
+    return dimensions, space
+
+
+class Results():
+    """
+    Collects (and prints) the results as they come.
+    """
+    def __init__(self):
+        self.entries = []
+
+    def add(self, benchmark, seconds, operations = 1, metrics = None, **params):
+        """
+        Params tell runs of a benchmark apart, metrics are whatever else it measured along with the time it took.
+        """
+        per_operation = seconds / operations
+        entry = {"benchmark": benchmark, "params": params, "seconds": per_operation}
+        if metrics:
+            entry["metrics"] = metrics
+        self.entries.append(entry)
+
+        label = " ".join("{}={}".format(key, value) for key, value in dict(params, **(metrics or {})).items())
+        print("{:<36} {:<24} {:>14.3f} us {:>14.0f}/s".format(benchmark, label, per_operation * 1e6, 1 / per_operation))
+
+    def to_json(self):
+        return {
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "timestamp": time.time(),
+            "results": self.entries,
+        }
+
+
+def bench_space(results, sizes, operations = 10000):
+    for cells in sizes:
+        _, space = populated_space(cells)
+        snake = pysnakey.Snake([[0, 0]], pysnakey.KeyPress.DOWN)
+        positions = space.sample_unoccupied_positions(min(operations, space.free_count))
+
+        def occupy():
+            for position in positions:
+                space.occupy(position, snake)
+
+        def free():
+            for position in positions:
+                space.free(position)
+
+        # Each round has to leave the space as it found it.
+        occupied, freed = [], []
+        for _ in range(3):
+            occupied.append(best_of(occupy, 1))
+            freed.append(best_of(free, 1))
+        results.add("space.occupy", min(occupied), len(positions), grid = cells)
+        results.add("space.free", min(freed), len(positions), grid = cells)
+
+        results.add("space.is_occupied", best_of(lambda: [space.is_occupied(p) for p in positions]), len(positions), grid = cells)
+        results.add("space.get_random_unoccupied_position",
+                    best_of(lambda: [space.get_random_unoccupied_position() for _ in range(operations)]), operations, grid = cells)
+
+
+def bench_snake_update(results, lengths, steps = 500):
+    """
+    Moves snakes of all lengths around a space big enough for them, which shouldn't take longer for longer ones.
+    """
+    cells = 1000
+    for length in lengths:
+        space = pysnakey.Space((cells + 20, cells + 20), 1, 10)
+        logic = pysnakey.SnakeGame.Logic(space)
+
+        # Back and forth across the space, row after row, heading down once done.
+        body = []
+        for i in range(length):
+            row, column = divmod(i, cells)
+            body.append([column if row % 2 == 0 else cells - 1 - column, row])
+        snake = pysnakey.Snake(body, pysnakey.KeyPress.DOWN)
+        snake.place(logic)
+
+        results.add("snake.update", best_of(lambda: [snake.update(logic, pysnakey.KeyPress.DOWN) for _ in range(steps)], 1),
+                    steps, length = length)
+
+
+def bench_should_grow(results, sizes, operations = 10000):
+    for cells in sizes:
+        _, space = populated_space(cells)
+        logic = pysnakey.SnakeGame.Logic(space)
+        positions = space.sample_unoccupied_positions(min(operations, space.free_count))
+        results.add("logic.should_grow", best_of(lambda: [logic.should_grow(p) for p in positions]), len(positions), grid = cells)
+
+
+def bench_snake_ui(results, sizes):
+    """
+    Full redraws of SnakeUI: drawing every cell in a loop against blitting it through the palette.
+    """
+    for cells in sizes:
+        quantum = quantum_for(cells)
+        dimensions, space = populated_space(cells, quantum)
+        ui = pysnakey.SnakeUI(dimensions, quantum, pysnakey.SPACE_BORDER_WIDTH)
+
+        # Drawing millions of cells one by one takes a while, no need to do it over and over.
+        repeat = 3 if cells <= 500 else 1
+        results.add("snake_ui.draw_space", best_of(lambda: ui._draw_space(space), repeat), grid = cells)
+        results.add("snake_ui.blit_space", best_of(lambda: ui._blit_space(space), repeat), grid = cells)
+
+
+def bench_terminal_ui(results, steps = 200):
+    """
+    TerminalUI frames as the snake moves around, in time and in bytes, which shouldn't depend on the terminal size.
+    """
+    import io
+
+    for size in ((80, 24), (240, 80)):
+        stream = io.BytesIO()
+        ui = pysnakey.TerminalUI(stream, size)
+        engine = pysnakey.SnakeEngine(((size[0] - 2) // 2 * 10, (size[1] - 2) * 10), 10, 0, seed = 0)
+        ui.follow(lambda: engine.head)
+        ui.draw(engine.space)
+
+        def play():
+            for i in range(steps):
+                if engine.done:
+                    engine.reset(0)
+                engine.step(pysnakey.KeyPress.RIGHT if (i // 10) % 2 else pysnakey.KeyPress.DOWN)
+                ui.draw(engine.space)
+
+        first = ui.stats()["bytes"]
+        results.add("terminal_ui.draw", best_of(play, 1), steps, terminal = "{}x{}".format(*size))
+        print("{:<36} {:<24} {:>14.1f} bytes/frame".format("", "", (ui.stats()["bytes"] - first) / steps))
+
+
+def bench_aurabox_payload(results, sizes, frames = 1000):
+    # The sender only connects once there's something to send, and there won't be.
+    ui = pysnakey.AuraboxUI("file://" + os.devnull)
+    for cells in sizes:
+        _, space = populated_space(cells)
+        results.add("aurabox_ui.build_payload", best_of(lambda: [ui._build_payload(space) for _ in range(frames)]), frames, grid = cells)
+    ui.close()
+
+
+def bench_frame_encoder(results, frames = 2000):
+    """
+    Aurabox frames, from payload to escaped frame, against the emulator's straightforward encoder. The payloads are
+    the ones the box would get from seeded games played by the Autopilot, most of which have bytes to escape.
+    """
+    import aurabox_emulator
+
+    ui = pysnakey.AuraboxUI("file://" + os.devnull)
+    payloads = []
+    engine = pysnakey.SnakeEngine(seed = 0)
+    seed = 0
+    while len(payloads) < frames:
+        engine.reset(seed)
+        autopilot = pysnakey.Autopilot()
+        while not engine.done and len(payloads) < frames:
+            engine.step(autopilot(engine))
+            payloads.append(bytes(ui._build_payload(engine.space)))
+        seed += 1
+    ui.close()
+
+    escaped = sum(1 for payload in payloads if any(byte in payload for byte in (0x01, 0x02, 0x03)))
+    encoder = pysnakey.FrameEncoder(len(payloads[0]))
+
+    def encode(function):
+        return lambda: [function(payload) for payload in payloads]
+
+    results.add("frame_encoder.encode", best_of(encode(encoder.encode)), len(payloads), escaped = escaped)
+    results.add("frame_encoder.reference", best_of(encode(aurabox_emulator.encode_frame)), len(payloads), escaped = escaped)
+
+
+def bench_fork(results, sizes, operations = 100):
+    """
+    Forking a running game: cloning it, packing it in a snapshot and restoring it, against a plain deepcopy.
+    """
+    import copy
+
+    for cells in sizes:
+        engine = pysnakey.SnakeEngine((cells + 20, cells + 20), 1, 10, seed = 0)
+        for _ in range(min(cells, 100)):
+            engine.step()
+        buffer = engine.snapshot()
+
+        results.add("engine.clone", best_of(lambda: [engine.clone() for _ in range(operations)]), operations, grid = cells)
+        results.add("engine.snapshot", best_of(lambda: [engine.snapshot(buffer = buffer) for _ in range(operations)]), operations, grid = cells)
+        results.add("engine.restore", best_of(lambda: [engine.restore(buffer) for _ in range(operations)]), operations, grid = cells)
+        results.add("engine.deepcopy", best_of(lambda: [copy.deepcopy(engine) for _ in range(operations // 10 or 1)]), operations // 10 or 1, grid = cells)
+
+
+def bench_arena(results, sizes, snakes = (10, 100, 1000), steps = 200):
+    """
+    Arena ticks, which should cost the same however large the board, for as many snakes.
+    """
+    for cells in sizes:
+        for count in snakes:
+            if count * 2 > cells * cells // 4:
+                continue
+            arena = pysnakey.Arena(count, count, (cells, cells), 1, 0, seed = 0, respawn = True)
+            results.add("arena.step", best_of(lambda: [arena.step() for _ in range(steps)], 1), steps, grid = cells, snakes = count)
+
+
+def bench_autopilot(results, sizes, steps = 200, games = 20):
+    """
+    Autopilot decisions, including the distance fields computed along the way, with no time budget, and whole
+    games played by it.
+    """
+    for cells in sizes:
+        engine = pysnakey.SnakeEngine((cells + 20, cells + 20), 1, 10, seed = 0)
+        autopilot = pysnakey.Autopilot()
+
+        def play():
+            for _ in range(steps):
+                if engine.done:
+                    engine.reset(0)
+                engine.step(autopilot(engine))
+
+        results.add("autopilot.decide", best_of(play, 1), steps, grid = cells)
+
+    # Seeded games on the default space, which should all end well before running out of ticks: any still going by
+    # then got stuck going round in circles, and `stuck` counts them.
+    harness = pysnakey.GameHarness(pysnakey.Autopilot(), workers = 1, max_ticks = 20000)
+    games = harness.run(games, seed = 1)
+    stuck = int((games["cause"] == pysnakey.BatchedSnakeEngine.ALIVE).sum())
+    results.add("autopilot.games", harness.elapsed, len(games), metrics = {"stuck": stuck})
+
+
+def bench_harness(results, games = 2000):
+    """
+    Headless games per second on a single process, and spread over every core.
+    """
+    for workers in sorted({1, os.cpu_count() or 1}):
+        harness = pysnakey.GameHarness(pysnakey.GameHarness.random_policy, workers = workers, batch = 250)
+        harness.run(games, seed = 0)
+        results.add("harness.run", harness.elapsed, games, workers = workers)
+
+
+def bench_startup(results, repeat = 5):
+    """
+    How long until the game gets going, from a fresh interpreter: importing pysnakey, and a headless game from the
+    command line, next to an interpreter doing nothing at all. Importing should never get to load pygame.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def run(*args):
+        start = time.perf_counter()
+        process = subprocess.run([sys.executable] + list(args), cwd = here, stdout = subprocess.DEVNULL)
+        return time.perf_counter() - start, process.returncode
+
+    def best(*args):
+        return min(run(*args) for _ in range(repeat))
+
+    results.add("startup.interpreter", best("-c", "pass")[0], 1)
+    seconds, pygame = best("-c", "import sys, pysnakey; sys.exit('pygame' in sys.modules)")
+    results.add("startup.import", seconds, 1, pygame = bool(pygame))
+    results.add("startup.headless", best("pysnakey.py", "--backend", "headless", "--games", "1", "--workers", "1")[0], 1)
+
+
+def compare(results, path):
+    """
+    Prints how each benchmark did against the ones in the given file.
+    """
+    with open(path) as f:
+        before = json.load(f)
+
+    key = lambda entry: (entry["benchmark"], json.dumps(entry["params"], sort_keys = True))
+    previous = {key(entry): entry for entry in before["results"]}
+
+    print("\nCompared to {}:".format(before.get("commit") or path))
+    regressions = 0
+    for entry in results.entries:
+        old = previous.get(key(entry))
+        if old is None:
+            continue
+        ratio = entry["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            flag = "  <-- slower"
+            regressions += 1
+
+        # Metrics only get mentioned when they changed.
+        metrics, old_metrics = entry.get("metrics", {}), old.get("metrics", {})
+        for name in sorted(set(metrics) | set(old_metrics)):
+            if metrics.get(name) != old_metrics.get(name):
+                flag += "  {}: {} -> {}".format(name, old_metrics.get(name), metrics.get(name))
+        print("{:<36} {:<24} {:>8.2f}x{}".format(entry["benchmark"], json.dumps(entry["params"]), ratio, flag))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)),
+                                       stderr = subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "pysnakey benchmarks")
+    parser.add_argument("--output", help = "write the results to this JSON file")
+    parser.add_argument("--compare", help = "compare against the results in this JSON file")
+    parser.add_argument("--quick", action = "store_true", help = "stick to the smaller sizes")
+    parser.add_argument("--only", action = "append", help = "only run benchmarks whose name contains this")
+    args = parser.parse_args(argv)
+
+    sizes = tuple(s for s in GRID_SIZES if s <= 500) if args.quick else GRID_SIZES
+    lengths = tuple(l for l in SNAKE_LENGTHS if l <= 10000) if args.quick else SNAKE_LENGTHS
+
+    benchmarks = (
+        ("space", lambda results: bench_space(results, sizes)),
+        ("snake_update", lambda results: bench_snake_update(results, lengths)),
+        ("should_grow", lambda results: bench_should_grow(results, sizes)),
+        ("snake_ui", lambda results: bench_snake_ui(results, sizes)),
+        ("terminal_ui", bench_terminal_ui),
+        ("aurabox_payload", lambda results: bench_aurabox_payload(results, sizes)),
+        ("frame_encoder", bench_frame_encoder),
+        ("fork", lambda results: bench_fork(results, sizes)),
+        ("arena", lambda results: bench_arena(results, sizes)),
+        ("autopilot", lambda results: bench_autopilot(results, sizes)),
+        ("harness", bench_harness),
+        ("startup", bench_startup),
+    )
+
+    results = Results()
+    for name, run in benchmarks:
+        if not args.only or any(only in name for only in args.only):
+            run(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results.to_json(), f, indent = 2)
+
+    if args.compare:
+        return 1 if compare(results, args.compare) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
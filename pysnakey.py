@@ -1,12 +1,16 @@
+import os
 import sys
-import pygame
+import time
 import random
+import copy
+import socket
+import struct
+import weakref
+import threading
 import numpy
 
-# UI
-# from time import sleep
-# from aurabox import *
-# from bluetooth import find_service, BluetoothSocket, RFCOMM
+# pygame is only imported by the parts that need it (windows, clocks and events), so that the game itself can be
+# simulated without it.
 
 # Optional, only for PC, this is why we override the previous space definition
 SPACE_DIMENSIONS = (520, 520)
@@ -17,20 +21,23 @@ SPACE_FPS = 20
 # Affects the speed of the game
 GAME_DIFFICULTY = 10
 GAME_QUANTUM = SPACE_FPS * GAME_DIFFICULTY
-GAME_QUANTUM_EVENT = pygame.USEREVENT
 
 # ----------------------------------------------------
 class GameOver(BaseException):
     def __init__(self, str, *args, **kwargs):
-        print(str)
+        super(GameOver, self).__init__(str)
 
 class InvalidPositionGameOver(GameOver):
     def __init__(self, str, *args, **kwargs):
-        super(InvalidPositionGameOver, self).__init__(args, kwargs)
+        super(InvalidPositionGameOver, self).__init__(str, args, kwargs)
 
 class AteItselfGameOver(GameOver):
     def __init__(self, str, *args, **kwargs):
-        super(AteItselfGameOver, self).__init__(args, kwargs)
+        super(AteItselfGameOver, self).__init__(str, args, kwargs)
+
+class SpaceFilledGameOver(GameOver):
+    def __init__(self, str, *args, **kwargs):
+        super(SpaceFilledGameOver, self).__init__(str, args, kwargs)
 
 # ----------------------------------------------------
 class KeyPress():
@@ -40,8 +47,8 @@ class KeyPress():
         self.set(value)
 
     @staticmethod
-    def random_key():
-        return random.randint(KeyPress.LEFT, KeyPress.DOWN)
+    def random_key(rng = None):
+        return (rng if rng is not None else random).randint(KeyPress.LEFT, KeyPress.DOWN)
 
     @staticmethod
     def is_valid(value):
@@ -76,8 +83,65 @@ class KeyPress():
             raise ValueError()
         return ""
 
+# ----------------------------------------------------
+class InputQueue():
+    """
+    Key presses waiting for their tick, oldest first, along with when they happened.
+
+    It's a fixed ring of `capacity` slots: pushing a press only writes a couple of slots, and presses coming in
+    while it's full are dropped (and counted). Each tick takes at most one turn out of it, so quick successions of
+    presses (say, up then left to turn around) play out over as many ticks instead of the last one winning.
+    """
+    def __init__(self, capacity = 8):
+        self._directions = [0] * capacity
+        self._times = [0.0] * capacity
+        self._first = 0
+        self._count = 0
+        self._dropped = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    def push(self, direction, timestamp):
+        capacity = len(self._directions)
+        if self._count == capacity:
+            self._dropped += 1
+            return False
+
+        slot = (self._first + self._count) % capacity
+        self._directions[slot] = direction
+        self._times[slot] = timestamp
+        self._count += 1
+        return True
+
+    def clear(self):
+        self._count = 0
+
+    def pop_turn(self, current, is_valid):
+        """
+        Takes the oldest press that makes for an actual turn from the current direction, according to `is_valid`,
+        throwing away whichever came before it and don't. Returns it as (direction, timestamp), or None.
+        """
+        capacity = len(self._directions)
+        while self._count:
+            slot = self._first
+            self._first = (slot + 1) % capacity
+            self._count -= 1
+
+            direction = self._directions[slot]
+            if direction != current and is_valid(current, direction):
+                return direction, self._times[slot]
+        return None
+
 # ----------------------------------------------------
 class Element():
+    # The kinds of elements our universe knows about. These double as their cell representation.
+    EMPTY, SNAKE, EDIBLE, WALL = range(0, 4)
+
     def __init__(self, representation):
         if representation is None:
             raise ValueError("Invalid argument provided for the element representation")
@@ -85,47 +149,87 @@ class Element():
 
 # ----------------------------------------------------
 class EmptyElement(Element):
+    KIND = Element.EMPTY
+
     def __init__(self):
-        super(EmptyElement, self).__init__(0)
+        super(EmptyElement, self).__init__(EmptyElement.KIND)
         pass
 
 # ----------------------------------------------------
-class Space():
+class BaseSpace():
     """
-    A representation of our snakey world
+    Whatever our snakey worlds have in common, however they keep their cells: the table translating entity codes
+    back to their elements, positions and their validity, and reading or writing cells through them.
+
+    Subclasses keep the cells (and their `_shape`), and say how to read one (`_code` and `_kind`), how to write one (`_put`), how to copy
+    a rectangle of kinds out (`_read_kinds`), and how to find free cells.
     """
-    def __init__(self, dimensions, quantum, border_width = 0):
-        self._space = self._quantize(dimensions, quantum, border_width)
-        pass
-    
-    def get_random_unoccupied_position(self):
-        free = []
-        for x, row in enumerate(self._space):
-            for y, elm in enumerate(row):
-                if isinstance(elm, EmptyElement):
-                    free.append([x,y])
-        return random.choice(free)
+    MAX_ENTITIES = numpy.iinfo(numpy.int16).max
+
+    def __init__(self, rng = None):
+        # Side table translating codes back to their elements. Code 0 is reserved for the void.
+        self._entities = [EmptyElement()]
+        self._codes = {}
+
+        # Anything behaving like the random module will do. Defaults to the module itself.
+        self._random = rng if rng is not None else random
+
+    def clone(self, rng = None, entities = None):
+        """
+        A copy of the space. `entities` maps elements of this space to whatever takes their place in the copy, if
+        anything. Subclasses see to copying (or sharing) the cells.
+        """
+        clone = copy.copy(self)
+        clone._random = rng if rng is not None else self._random
+        clone._entities = [entities.get(who, who) for who in self._entities] if entities else list(self._entities)
+        clone._codes = {who: code for code, who in enumerate(clone._entities) if code}
+        return clone
+
+    def entity(self, code):
+        return self._entities[code]
+
+    def code_of(self, who):
+        """
+        Returns the code assigned to the element, registering it if we've never met it before.
+        """
+        code = self._codes.get(who)
+        if code is None:
+            code = len(self._entities)
+            if code > BaseSpace.MAX_ENTITIES:
+                raise ValueError("Too many elements in our universe. Giving up.")
+            self._entities.append(who)
+            self._codes[who] = code
+        return code
+
+    def seed(self, seed):
+        """
+        Makes the choice of random positions reproducible.
+        """
+        self._random = random.Random(seed)
 
     def is_valid(self, position):
-        x, y = position        
-        return (0 <= x < len(self._space)) and (0 <= y < len(self._space[0]))
+        x, y = position
+        width, height = self._shape
+        return (0 <= x < width) and (0 <= y < height)
 
     def occupy(self, position, value):
         x, y = position
         if self.is_valid(position):
-            self._space[x][y] = value
+            self._put(x, y, self.code_of(value), value._repr)
         else:
             raise ValueError("Invalid position passed to occupy. Giving up.")
 
     def free(self, position):
         x, y = position
-        elm  = self._space[x][y]
-        self._space[x][y] = EmptyElement()
+        if self.is_valid(position):
+            self._put(x, y, 0, Element.EMPTY)
+        else:
+            raise ValueError("Invalid position passed to free. Giving up.")
 
     def is_occupied(self, position):
         if self.is_valid(position):
             x, y = position
-            return self._space[x][y] != EmptyElement()
+            return self._kind(x, y) != Element.EMPTY
         else:
             raise ValueError("Invalid position provided. Giving up.")
 
@@ -135,24 +239,173 @@ class Space():
         """
         if self.is_valid(position):
             x, y = position
-            return isinstance(self._space[x][y], which_type)
+            return self._kind(x, y) == which_type.KIND
         return False
 
+    def region(self, x, y, width, height):
+        """
+        The kind of element on every cell of the given rectangle, as an array. Cells outside the world are empty.
+        """
+        kinds = numpy.zeros((width, height), dtype = numpy.uint8)
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + width, self._shape[0]), min(y + height, self._shape[1])
+        if left < right and top < bottom:
+            self._read_kinds(kinds[left - x:right - x, top - y:bottom - y], left, top)
+        return kinds
+
+    def __setitem__(self, key, value):
+        try:
+            x, y = key
+        except Exception as e:
+            # Bad.
+            raise ValueError("Cannot set space item. Invalid key provided. Expected: sequence with 2+ elements.")
+
+        if not self.is_valid(key):
+            raise ValueError("Cannot set space item. Invalid key provided: {} is out of bounds.".format(key))
+
+        # The kind first: whatever has none doesn't get to be registered.
+        kind = value._repr
+        self._put(x, y, self.code_of(value), kind)
+
+    def __getitem__(self, key):
+        try:
+            x, y = key
+            return self._entities[self._code(x, y)]
+        except Exception as e:
+            # Bad.
+            raise ValueError("Cannot retrieve space item. Invalid key provided. Expected: sequence with 2+ elements.")
+
+
+class Space(BaseSpace):
+    """
+    A representation of our snakey world
+
+    Cells hold integer codes rather than objects: `_cells` keeps a per-entity code, which `_entities` maps back
+    to the actual instance, whilst `_kinds` keeps the kind of element (empty, snake, edible, wall) on each cell.
+
+    Free cells are tracked as well, so picking a random one doesn't require scanning the whole thing: `_free` holds
+    the flattened index of every free cell in its first `_free_count` slots, and `_slots` points back from a cell to
+    its slot in `_free` (or -1 if occupied). Occupying a cell swaps it with the last free one, freeing it appends it.
+
+    Clones share all of those arrays with the space they come from, until either of them writes to a cell: `_owners`
+    counts how many spaces share them, and whoever writes while they're shared makes copies of its own first. A space
+    gives its share back once it's gone, so dropping a clone that never got written to leaves nothing to copy.
+    """
+    def __init__(self, dimensions, quantum, border_width = 0, rng = None):
+        super(Space, self).__init__(rng)
+        self._cells = self._quantize(dimensions, quantum, border_width)
+        self._kinds = numpy.zeros(self._cells.shape, dtype = numpy.uint8)
+        self._shape = self._cells.shape
+        self._height = self._cells.shape[1]
+
+        # Free cell index. Everything is free to begin with.
+        self._free = numpy.arange(self._cells.size, dtype = numpy.int64)
+        self._slots = numpy.arange(self._cells.size, dtype = numpy.int64)
+        self._free_count = self._cells.size
+        self._owners = [1]
+        self._lease = Space._lease_of(self)
+        pass
+
+    def clone(self, rng = None, entities = None):
+        """
+        A copy of the space, which costs next to nothing until either of them changes. `entities` maps elements of
+        this space to whatever takes their place in the copy, if anything.
+        """
+        clone = super(Space, self).clone(rng, entities)
+        clone._lease = Space._lease_of(clone)
+        self._owners[0] += 1
+        return clone
+
+    @staticmethod
+    def _lease_of(space):
+        """
+        The share of its arrays a space holds, which goes back as soon as the space is gone (see `_release`).
+        """
+        lease = [space._owners]
+        weakref.finalize(space, Space._release, lease).atexit = False
+        return lease
+
+    @staticmethod
+    def _release(lease):
+        if lease[0] is not None:
+            lease[0][0] -= 1
+            lease[0] = None
+
+    @property
+    def shape(self):
+        return self._cells.shape
+
+    @property
+    def kinds(self):
+        """
+        The kind of element on every cell, as an array. Meant to be read, not written.
+        """
+        return self._kinds
+
+    @property
+    def cells(self):
+        """
+        The entity code on every cell, as an array. Use `entity` to get back the element. Meant to be read, not written.
+        """
+        return self._cells
+
+    @property
+    def free_count(self):
+        return self._free_count
+
+    def get_random_unoccupied_position(self, rng = None):
+        if self._free_count == 0:
+            raise ValueError("No unoccupied position left. Giving up.")
+
+        rng = rng if rng is not None else self._random
+        return self._unflatten(self._free[rng.randrange(self._free_count)])
+
+    def sample_unoccupied_positions(self, k, rng = None):
+        """
+        Returns k distinct unoccupied positions, chosen at random.
+        """
+        if k > self._free_count:
+            raise ValueError("Not enough unoccupied positions ({}) for {} samples. Giving up.".format(self._free_count, k))
+
+        rng = rng if rng is not None else self._random
+        return [self._unflatten(self._free[slot]) for slot in rng.sample(range(self._free_count), k)]
+
     def contains(self, who):
         """
         Returns true if the element is already present in our universe
         """
-        return numpy.isin(who, self._space)
+        code = self._codes.get(who)
+        return code is not None and bool((self._cells == code).any())
 
     def where(self, who):
         """
         Returns the position of the element, assuming it's already present in our universe. 
         """
-        position = numpy.where(self._space == who)
-        if (position):
-            position = position[0][0], position[1][0]
+        code = self._codes.get(who)
+        if code is None:
+            return None
 
-        return position
+        position = numpy.argwhere(self._cells == code)
+        if len(position):
+            return int(position[0][0]), int(position[0][1])
+        return None
+
+    def region(self, x, y, width, height):
+        """
+        Same as BaseSpace.region, except that rectangles within the world come as a view rather than a copy.
+        """
+        if x >= 0 and y >= 0 and x + width <= self._kinds.shape[0] and y + height <= self._kinds.shape[1]:
+            return self._kinds[x:x + width, y:y + height]
+        return super(Space, self).region(x, y, width, height)
+
+    def _read_kinds(self, out, x, y):
+        out[...] = self._kinds[x:x + out.shape[0], y:y + out.shape[1]]
+
+    def _code(self, x, y):
+        return self._cells[x, y]
+
+    def _kind(self, x, y):
+        return self._kinds[x, y]
 
     def _quantize(self, dimensions, quantum, border_width):
         # usable axis quanta => dimension[axis] - (border_width  * 2) / quantum
@@ -160,101 +413,360 @@ class Space():
             return (axis - (border_width  * 2)) // quantum 
         
         space_range = get_range(dimensions[0]), get_range(dimensions[1])
-        return numpy.full(space_range, EmptyElement())
-
-    def __setitem__(self, key, value):
-        try:
-            x, y = key
-            self._space[x][y] = value
-        except Exception as e:
-            # Bad.
-            raise ValueError("Cannot set space item. Invalid key provided. Expected: sequence with 2+ elements.")
+        return numpy.zeros(space_range, dtype = numpy.int16)
 
-    def __getitem__(self, key):
-        try:
-            x, y = key
-            return self._space[x][y]
-        except Exception as e:
-            # Bad.
-            raise ValueError("Cannot retrieve space item. Invalid key provided. Expected: sequence with 2+ elements.")
+    def _put(self, x, y, code, kind):
+        """
+        Writes a cell, keeping the free cell index up to date.
+        """
+        if self._owners[0] > 1:
+            self._own()
+
+        was_free = self._kinds[x, y] == Element.EMPTY
+        self._cells[x, y] = code
+        self._kinds[x, y] = kind
+
+        is_free = kind == Element.EMPTY
+        if was_free == is_free:
+            return
+
+        index = x * self._height + y
+        if is_free:
+            self._free[self._free_count] = index
+            self._slots[index] = self._free_count
+            self._free_count += 1
+        else:
+            # Swap-remove: the last free cell takes over our slot.
+            slot = self._slots[index]
+            last = self._free[self._free_count - 1]
+            self._free[slot] = last
+            self._slots[last] = slot
+            self._slots[index] = -1
+            self._free_count -= 1
+
+    def _own(self):
+        """
+        Stops sharing arrays with clones (or whoever we were cloned from), by making copies of them.
+        """
+        Space._release(self._lease)
+        self._owners = [1]
+        self._lease[0] = self._owners
+        self._cells = self._cells.copy()
+        self._kinds = self._kinds.copy()
+        self._free = self._free.copy()
+        self._slots = self._slots.copy()
+
+    def _unflatten(self, index):
+        x, y = divmod(int(index), self._height)
+        return [x, y]
 
     def __iter__(self):
-        return self._space.__iter__()
-
-    def __next__(self):
-        return self._space.__next__()
+        return self._kinds.__iter__()
 
 # ----------------------------------------------------
-class Snake(Element):
-    class Node():
+class SparseSpace(BaseSpace):
+    """
+    Same world as Space, without the dense grid: cells live in fixed-size square chunks which only get allocated
+    when something occupies them, and go away once they're empty again. Memory follows what's on the board rather
+    than how large the board is, so worlds of 100k x 100k cells are fine.
+
+    `_chunks` maps the coordinates of a chunk (position // CHUNK_SIZE) to its codes, its kinds and how many of its
+    cells are occupied. There's no free cell index: random free cells are found by picking cells at random until one
+    is free, which takes a try or two as long as the world is mostly empty.
+    """
+    CHUNK_SIZE = 64
+
+    # Rejection sampling gives up after that many tries in a row. Only a world about full could get there.
+    MAX_TRIES = 10000
+
+    def __init__(self, dimensions, quantum = 1, border_width = 0, rng = None):
+        super(SparseSpace, self).__init__(rng)
+        self._shape = ((dimensions[0] - border_width * 2) // quantum, (dimensions[1] - border_width * 2) // quantum)
+        self._chunks = {}
+        self._occupied = 0
+        pass
+
+    def clone(self, rng = None, entities = None):
+        """
+        A copy of the space, chunks included: they're only as many as the cells occupied need.
+        """
+        clone = super(SparseSpace, self).clone(rng, entities)
+        clone._chunks = {key: [cells.copy(), kinds.copy(), count] for key, (cells, kinds, count) in self._chunks.items()}
+        return clone
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def chunk_count(self):
+        return len(self._chunks)
+
+    @property
+    def free_count(self):
+        return self._shape[0] * self._shape[1] - self._occupied
+
+    def get_random_unoccupied_position(self, rng = None):
+        if self.free_count == 0:
+            raise ValueError("No unoccupied position left. Giving up.")
+
+        rng = rng if rng is not None else self._random
+        width, height = self._shape
+        for _ in range(SparseSpace.MAX_TRIES):
+            x, y = rng.randrange(width), rng.randrange(height)
+            if self._kind(x, y) == Element.EMPTY:
+                return [x, y]
+        raise ValueError("Could not find an unoccupied position. The space is too crowded to be sparse. Giving up.")
+
+    def sample_unoccupied_positions(self, k, rng = None):
+        """
+        Returns k distinct unoccupied positions, chosen at random.
+        """
+        if k > self.free_count:
+            raise ValueError("Not enough unoccupied positions ({}) for {} samples. Giving up.".format(self.free_count, k))
+
+        rng = rng if rng is not None else self._random
+        positions = {}
+        while len(positions) < k:
+            x, y = self.get_random_unoccupied_position(rng)
+            positions[x, y] = [x, y]
+        return list(positions.values())
+
+    def contains(self, who):
+        """
+        Returns true if the element is already present in our universe
+        """
+        return self.where(who) is not None
+
+    def where(self, who):
+        """
+        Returns the position of the element, assuming it's already present in our universe.
+        """
+        code = self._codes.get(who)
+        if code is None:
+            return None
+
+        size = SparseSpace.CHUNK_SIZE
+        for (cx, cy), (cells, _, _) in self._chunks.items():
+            position = numpy.argwhere(cells == code)
+            if len(position):
+                return cx * size + int(position[0][0]), cy * size + int(position[0][1])
+        return None
+
+    def _read_kinds(self, out, x, y):
+        size = SparseSpace.CHUNK_SIZE
+        width, height = out.shape
+        for cx in range(x // size, (x + width - 1) // size + 1):
+            for cy in range(y // size, (y + height - 1) // size + 1):
+                chunk = self._chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+
+                # Overlap between the chunk and the rectangle, in world coordinates.
+                left, top = max(x, cx * size), max(y, cy * size)
+                right, bottom = min(x + width, (cx + 1) * size), min(y + height, (cy + 1) * size)
+                out[left - x:right - x, top - y:bottom - y] = chunk[1][left - cx * size:right - cx * size, top - cy * size:bottom - cy * size]
+
+    def _code(self, x, y):
+        size = SparseSpace.CHUNK_SIZE
+        chunk = self._chunks.get((x // size, y // size))
+        return 0 if chunk is None else chunk[0][x % size, y % size]
+
+    def _kind(self, x, y):
+        size = SparseSpace.CHUNK_SIZE
+        chunk = self._chunks.get((x // size, y // size))
+        return Element.EMPTY if chunk is None else chunk[1][x % size, y % size]
+
+    def _put(self, x, y, code, kind):
         """
-        Represents a part of the snake.
+        Writes a cell, allocating its chunk if need be and dropping it once it's empty.
         """
-        def __init__(self, position):
-            self._position = position
+        size = SparseSpace.CHUNK_SIZE
+        key = (x // size, y // size)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            if kind == Element.EMPTY:
+                return
+            chunk = self._chunks[key] = [numpy.zeros((size, size), dtype = numpy.int16), numpy.zeros((size, size), dtype = numpy.uint8), 0]
+
+        cells, kinds, _ = chunk
+        x, y = x % size, y % size
+        was_free = kinds[x, y] == Element.EMPTY
+        cells[x, y] = code
+        kinds[x, y] = kind
+
+        is_free = kind == Element.EMPTY
+        if was_free == is_free:
+            return
+
+        change = -1 if is_free else 1
+        chunk[2] += change
+        self._occupied += change
+        if chunk[2] == 0:
+            del self._chunks[key]
 
-    def __init__(self, position = None, direction = None):
+# ----------------------------------------------------
+class Snake(Element):
+    """
+    The mighty snake. Its body lives in a ring buffer of coordinates, running from the tail to the head, so moving
+    along only touches both ends of it.
+    """
+    KIND = Element.SNAKE
+
+    # Movement vector for each direction, indexed by the direction itself.
+    VECTORS = ((-1, 0), (0, -1), (1, 0), (0, 1))
+
+    # The body doubles its storage whenever it runs out of it.
+    INITIAL_CAPACITY = 64
+
+    def __init__(self, position = None, direction = None, capacity = None):
         if position is None:
             raise ValueError("Invalid initial provided to the mighty snake. Cannot proceed.")
 
         if direction is None:
             raise ValueError("Invalid initial vector to the mighty snake. Cannot proceed.")
-        
-        self._nodes = []
+        super(Snake, self).__init__(Snake.KIND)
+
+        capacity = max(capacity or Snake.INITIAL_CAPACITY, len(position))
+        self._body = numpy.empty((capacity, 2), dtype = numpy.int32)
+        self._tail = 0
+        self._length = 0
         for pos in position:
-            self._nodes.append(Snake.Node(pos))
+            self._push(pos)
+        self._head = tuple(int(c) for c in position[-1])
 
         self._direction = direction
         pass
 
+    def __len__(self):
+        return self._length
+
+    @property
+    def head(self):
+        return self._head
+
+    @property
+    def tail(self):
+        return tuple(self._body[self._tail].tolist())
+
+    def positions(self):
+        """
+        Yields every position of the snake, from the tail to the head.
+        """
+        capacity = len(self._body)
+        for i in range(self._length):
+            yield tuple(self._body[(self._tail + i) % capacity].tolist())
+
+    def place(self, game):
+        """
+        Puts the whole snake in the game. Afterwards, only its ends get updated.
+        """
+        for pos in self.positions():
+            game.occupy(pos, self)
+
     def update(self, game, direction):
-        # Updating the snake is essentially creating a new node, and destroying the last one.
-        new_velocity = self._derive_vector(direction)
-        new_position = list(numpy.add(new_velocity, self._nodes[-1]._position))
-        
+        # Updating the snake is essentially creating a new head, and destroying the tail.
+        dx, dy = self._derive_vector(direction)
+        new_position = (self._head[0] + dx, self._head[1] + dy)
+
         should_grow = game.should_grow(new_position)
-        self._nodes.append(Snake.Node(new_position))
+        self._push(new_position)
+        self._head = new_position
 
-        # Delete the last one, unless we have to grow.
+        # Delete the tail, unless we have to grow.
         if not should_grow:
-            last = self._nodes.pop(0)
-            
             # Free the last position, so it can be redrawn
-            game.free(last._position)
-        
-        for pos in self._nodes:
-            game.occupy(pos._position, self)
+            game.free(self._pop())
+
+        game.occupy(new_position, self)
+
+    def _push(self, position):
+        if self._length == len(self._body):
+            self._grow()
+
+        index = (self._tail + self._length) % len(self._body)
+        self._body[index] = position
+        self._length += 1
+
+    def _pop(self):
+        position = self._body[self._tail].tolist()
+        self._tail = (self._tail + 1) % len(self._body)
+        self._length -= 1
+        return position
+
+    def _grow(self):
+        body = numpy.empty((len(self._body) * 2, 2), dtype = numpy.int32)
+        body[:self._length] = numpy.roll(self._body, -self._tail, axis = 0)
+        self._body = body
+        self._tail = 0
 
     def _derive_vector(self, direction):
-        if (direction == KeyPress.LEFT):
-            return (-1, 0)
-        elif (direction == KeyPress.UP):
-            return (0, -1)
-        elif (direction == KeyPress.RIGHT):
-            return (1, 0)
-        elif (direction == KeyPress.DOWN):
-            return (0, 1)
-        else:
-            raise ValueError("Invalid direction ({}) provided. Cannot proceed.".format(direction))
+        value = direction.value if isinstance(direction, KeyPress) else direction
+        if KeyPress.is_valid(value):
+            return Snake.VECTORS[value]
+        raise ValueError("Invalid direction ({}) provided. Cannot proceed.".format(direction))
 
 # ----------------------------------------------------
 class Edible(Element):
+    KIND = Element.EDIBLE
+
     def __init__(self, position = None):
         if position is None:
             raise ValueError("Invalid position provided to the delicious edible. Cannot proceed.")
+        super(Edible, self).__init__(Edible.KIND)
         self._position = position
         self._new_position = position
+        self._placed = False
         pass
 
+    @property
+    def position(self):
+        return self._new_position
+
     def set_position(self, position):
         self._new_position = position
 
     def update(self, game):
-        if self._position != self._new_position:
-            self._position = self._new_position
+        # Nothing to do unless we've moved (or haven't been placed yet).
+        if self._placed and self._position == self._new_position:
+            return
 
+        self._position = self._new_position
         game.occupy(self._position, self)
-        pass
+        self._placed = True
+
+# ----------------------------------------------------
+class Viewport():
+    """
+    The part of a space that fits in a view of `size` cells: all of it, if it fits, or else whatever's around the
+    position `focus` returns (e.g. the head of the snake). The view only moves once that gets near its edges, and
+    then by half a view, so that most frames still only change a few cells.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.origin = (0, 0)
+        self.focus = None
+
+    def visible(self, space):
+        """
+        The kinds of the cells in view, moving the view along if need be.
+        """
+        width, height = space.shape
+        if width <= self.size[0] and height <= self.size[1]:
+            self.origin = (0, 0)
+            return space.region(0, 0, width, height)
+
+        view = min(width, self.size[0]), min(height, self.size[1])
+        origin = list(self.origin)
+        focus = self.focus() if self.focus is not None else origin
+        for axis in (0, 1):
+            margin = view[axis] // 4
+            if not (origin[axis] + margin <= focus[axis] < origin[axis] + view[axis] - margin):
+                origin[axis] = focus[axis] - view[axis] // 2
+            origin[axis] = max(0, min(origin[axis], space.shape[axis] - view[axis]))
+
+        self.origin = tuple(origin)
+        return space.region(origin[0], origin[1], view[0], view[1])
 
 # ----------------------------------------------------
 class SnakeUI():
@@ -263,165 +775,2332 @@ class SnakeUI():
     RED = (128, 0, 0)
     GREEN = (0, 128, 0)
 
-    def __init__(self):
-        self._screen = pygame.display.set_mode(SPACE_DIMENSIONS)
+    # Colour of each kind of element, indexed by the kind itself.
+    PALETTE = (WHITE, GREEN, RED, BLACK)
+
+    def __init__(self, dimensions = SPACE_DIMENSIONS, quantum = SPACE_QUANTUM, border_width = SPACE_BORDER_WIDTH, blit = False):
+        import pygame
+        self._dimensions = dimensions
+        self._quantum = quantum
+        self._border_width = border_width
+        self._screen = pygame.display.set_mode(dimensions)
+
+        # What's currently on screen (kind per cell), so that only what changed gets redrawn. None means nothing is.
+        self._drawn = None
+        self._drawn_size = None
+
+        # Full redraws can go through a palette instead of drawing cells one by one, which pays off on large spaces.
+        self._blit = blit
+        self._palette = numpy.array(SnakeUI.PALETTE, dtype = numpy.uint8)
+        self._cells = None
+        self._scaled = None
+
+        # Spaces larger than the window only get shown around whatever we follow (see `follow`).
+        self._viewport = Viewport(((dimensions[0] - border_width * 2) // quantum, (dimensions[1] - border_width * 2) // quantum))
         pass
 
+    def invalidate(self):
+        """
+        Forces the next draw to repaint everything, e.g. after the window got resized or exposed.
+        """
+        self._drawn = None
+
+    def follow(self, focus):
+        """
+        Keeps whatever position the given callable returns (e.g. the head of the snake) within view, for spaces
+        that don't fit in the window.
+        """
+        self._viewport.focus = focus
+
     def draw(self, space):
-        self._screen.fill(SnakeUI.BLACK)
-        self._draw_borders()
+        import pygame
+        origin = self._viewport.origin
+        kinds = self._viewport.visible(space)
+        size = self._screen.get_size()
 
-        # Effectively draws the game.
-        self._draw_space(space)
-        
-        pygame.display.flip()
+        if self._drawn is None or self._drawn.shape != kinds.shape or self._drawn_size != size or self._viewport.origin != origin:
+            self._screen.fill(SnakeUI.BLACK)
+
+            # Effectively draws the game.
+            if self._blit:
+                self._blit_cells(kinds)
+            else:
+                self._draw_cells(kinds)
+            self._draw_borders()
+
+            pygame.display.flip()
+            self._drawn = kinds.copy()
+            self._drawn_size = size
+            return
+
+        # Usually just the head, the tail and the edible.
+        changed = numpy.argwhere(kinds != self._drawn).tolist()
+        if not changed:
+            return
+
+        rects = [self._draw_cell(x, y, kinds[x, y]) for x, y in changed]
+        self._drawn[...] = kinds
+        pygame.display.update(rects)
 
     def _draw_space(self, space):
         """ 
         Does the actual rendering of the game.
         """
-        for x, row in enumerate(space):
+        self._draw_cells(self._viewport.visible(space))
+
+    def _blit_space(self, space):
+        """
+        Same as _draw_space, in one go. See `_blit_cells`.
+        """
+        self._blit_cells(self._viewport.visible(space))
+
+    def _draw_cells(self, kinds):
+        for x, row in enumerate(kinds.tolist()):
             # Take offset into account in this hack
-            for y, elm in enumerate(row):
-                if isinstance(elm, EmptyElement):
-                    position = self._translate_coords(x, y)
-                    pygame.draw.rect(self._screen, SnakeUI.WHITE, (position[0], position[1], SPACE_QUANTUM, SPACE_QUANTUM))
+            for y, kind in enumerate(row):
+                self._draw_cell(x, y, kind)
 
-                elif isinstance(elm, Edible):
-                    position = self._translate_coords(x, y)
-                    pygame.draw.rect(self._screen, SnakeUI.RED, (position[0], position[1], SPACE_QUANTUM, SPACE_QUANTUM))
+    def _blit_cells(self, kinds):
+        """
+        Colours the cells through the palette onto a surface with a pixel per cell, which is then scaled up and
+        blitted to the screen.
+        """
+        import pygame
+        if self._cells is None or self._cells.get_size() != kinds.shape:
+            self._cells = pygame.Surface(kinds.shape)
+            self._scaled = pygame.Surface((kinds.shape[0] * self._quantum, kinds.shape[1] * self._quantum))
 
-                elif isinstance(elm, Snake):
-                    position = self._translate_coords(x, y)
-                    pygame.draw.rect(self._screen, SnakeUI.GREEN, (position[0], position[1], SPACE_QUANTUM, SPACE_QUANTUM))
+        pygame.surfarray.blit_array(self._cells, self._palette[kinds])
+        pygame.transform.scale(self._cells, self._scaled.get_size(), self._scaled)
+        self._screen.blit(self._scaled, self._translate_coords(0, 0))
 
-                else:
-                    # Shouldn't happen.
-                    print ("- BAD: ({},{}) -> {}".format(x, y, elm))
+    def _draw_cell(self, x, y, kind):
+        """
+        Draws a single cell, returning the area of the screen it covers.
+        """
+        import pygame
+        position = self._translate_coords(x, y)
+        return pygame.draw.rect(self._screen, SnakeUI.PALETTE[kind], (position[0], position[1], self._quantum, self._quantum))
 
     def _draw_borders(self):
         """ 
         Borders are nothing but a hollow rectangular shape encompassing the screen. 
         """
-        pygame.draw.rect(self._screen, SnakeUI.BLACK, (0, 0, SPACE_DIMENSIONS[0], SPACE_DIMENSIONS[1]), SPACE_BORDER_WIDTH)
+        import pygame
+        pygame.draw.rect(self._screen, SnakeUI.BLACK, (0, 0, self._dimensions[0], self._dimensions[1]), self._border_width)
 
     def _translate_coords(self, x, y):
         """ 
         Translates our cartesian representation to the coordinate sytem understood by pygame
         """
-        return SPACE_BORDER_WIDTH + (x * SPACE_QUANTUM), SPACE_BORDER_WIDTH + (y * SPACE_QUANTUM)
+        return self._border_width + (x * self._quantum), self._border_width + (y * self._quantum)
 
 
-class AuraboxUI():
-    # Empirically determined those values to be from 0 to 7.
-    BLACK, RED, GREEN, YELLOW, DARK_BLUE, PURPLE, LIGHT_BLUE, WHITE = range(8)
-    
-    DIMENSIONS = (10, 10)
+# ----------------------------------------------------
+class TerminalUI():
+    """
+    Draws the game in a terminal, with ANSI escape codes, for hosts without a display (or over SSH).
 
-    # TODO: Check how this behaves with the FPS!
-    FRAME_DELAY = 0.05
+    What's on the terminal is kept in a shadow copy, so each frame only moves the cursor to the cells that changed
+    and writes their glyphs, all in a single write. Cells are two columns wide, to look about square. Spaces larger
+    than the terminal get shown around whatever we follow, as in SnakeUI.
+    """
+    # Glyph of each kind of element, indexed by the kind itself: empty, snake, edible and wall.
+    GLYPHS = (b"\x1b[0m  ", b"\x1b[32m\xe2\x96\x88\xe2\x96\x88", b"\x1b[31m()", b"\x1b[0m##")
 
-    def __init__(self, addr):
-        self._sock = None
-        self._connect(addr)
-        self._out_buffer = []        
-        pass
+    CLEAR = b"\x1b[0m\x1b[2J\x1b[H"
+    HIDE_CURSOR, SHOW_CURSOR = b"\x1b[?25l", b"\x1b[?25h"
 
-    def _connect(self, addr):
-        service_matches = find_service( address = addr )
-        if len(service_matches) == 0:
-            print("Couldn't find the SPP service.")
-            sys.exit(1)
+    # Terminals are usually further away than windows: no need to draw as often.
+    FPS = 20
 
-        first_match = service_matches[0]
-        port = first_match["port"]
-        name = first_match["name"]
-        host = first_match["host"]
+    def __init__(self, stream = None, size = None):
+        # Bytes go straight to the terminal, without going through text encoding.
+        self._stream = stream if stream is not None else sys.stdout.buffer
+        columns, rows = size if size is not None else os.get_terminal_size(self._stream.fileno())
 
-        # TODO: DEBUG DEBUG
-        print("Connecting to \"%s\" on %s" % (name, host))
+        # A border all around, and two columns per cell.
+        self._viewport = Viewport(((columns - 2) // 2, rows - 2))
+        self._drawn = None
 
-        # Create the client socket
-        self._sock = BluetoothSocket( RFCOMM )
-        self._sock.connect((host, port))
+        self._frames = 0
+        self._bytes = 0
+        self._last = 0
+        self._max = 0
+
+    def invalidate(self):
+        """
+        Forces the next draw to repaint everything, e.g. after the terminal got cleared.
+        """
+        self._drawn = None
+
+    def follow(self, focus):
+        self._viewport.focus = focus
 
     def draw(self, space):
-        payload = self._build_payload(space)
-        if payload is not None:
-            raw_frame = self._build_raw_frame(payload)
-            self._send_frame(raw_frame)
+        origin = self._viewport.origin
+        kinds = self._viewport.visible(space)
 
-        pass
+        if self._drawn is None or self._drawn.shape != kinds.shape or self._viewport.origin != origin:
+            out = [TerminalUI.CLEAR, TerminalUI.HIDE_CURSOR, self._border(kinds.shape)]
+            xs, ys = numpy.nonzero(kinds != Element.EMPTY)
+            self._drawn = kinds.copy()
+        else:
+            out = []
+            xs, ys = numpy.nonzero(kinds != self._drawn)
+            if not len(xs):
+                return
+            self._drawn[xs, ys] = kinds[xs, ys]
+
+        # Row after row, so that cells next to each other don't need the cursor moved in between.
+        order = numpy.lexsort((xs, ys))
+        glyphs = TerminalUI.GLYPHS
+        cursor = None
+        for x, y, kind in zip(xs[order].tolist(), ys[order].tolist(), kinds[xs[order], ys[order]].tolist()):
+            if cursor != (x, y):
+                out.append(b"\x1b[%d;%dH" % (y + 2, x * 2 + 2))
+            out.append(glyphs[kind])
+            cursor = (x + 1, y)
+        out.append(b"\x1b[0m")
+
+        frame = b"".join(out)
+        self._stream.write(frame)
+        self._stream.flush()
+
+        self._frames += 1
+        self._bytes += len(frame)
+        self._last = len(frame)
+        self._max = max(self._max, len(frame))
+
+    def stats(self):
+        return {
+            "frames": self._frames,
+            "bytes": self._bytes,
+            "bytes_per_frame": self._bytes / self._frames if self._frames else 0.0,
+            "last_frame": self._last,
+            "max_frame": self._max,
+        }
 
-    def _build_payload(self, space):
+    def close(self):
         """
-        Buils an Aurabox-like payload from a given space
+        Leaves the terminal as we found it, with the cursor below the game.
         """
+        rows = self._drawn.shape[1] + 3 if self._drawn is not None else 1
+        self._stream.write(b"\x1b[0m\x1b[%d;1H" % rows + TerminalUI.SHOW_CURSOR)
+        self._stream.flush()
 
-        # A payload is represented by 50 bytes, with each nibble representing a pixel.
-        # A byte represents consecutive elements on a row.
+    def _border(self, shape):
+        width, height = shape
+        line = b"+" + b"-" * (width * 2) + b"+"
+        side = b"|" + b" " * (width * 2) + b"|"
+        rows = [line] + [side] * height + [line]
+        return b"\x1b[0m" + b"".join(b"\x1b[%d;1H" % (row + 1) + text for row, text in enumerate(rows))
 
-        # Like Rolling Stones, let's paint it black first.
-        frame = [AuraboxUI.BLACK] * 50
+# ----------------------------------------------------
+class Transport():
+    """
+    Somewhere to send frames to: the device itself, or anything pretending to be it.
 
-        for x, row in enumerate(space):
-            # Take offset into account in this hack
-            for y, elm in enumerate(row):
-                if isinstance(elm, EmptyElement):
-                    self._draw_pixel(frame, x, y, AuraboxUI.BLACK)
-                    pass
+    `connect` (re)opens the link and returns the transport itself, `send` writes all the buffers given in a single
+    vectored write whenever the link allows for it.
+    """
+    def __init__(self):
+        self._sock = None
 
-                elif isinstance(elm, Edible):
-                    self._draw_pixel(frame, x, y, AuraboxUI.RED)
-                    pass
+    @staticmethod
+    def for_address(address):
+        """
+        Makes a transport from its address: tcp://host:port, unix:///path, file:///path (files or named pipes) or
+        rfcomm://11:22:33:44:55:66. A bare bluetooth address stands for RFCOMM.
+        """
+        scheme, _, rest = address.partition("://")
+        if not rest:
+            scheme, rest = "rfcomm", address
+
+        if scheme == "tcp":
+            host, _, port = rest.rpartition(":")
+            return TcpTransport(host, int(port))
+        elif scheme == "unix":
+            return UnixTransport(rest)
+        elif scheme == "file":
+            return FileTransport(rest)
+        elif scheme == "rfcomm":
+            return RfcommTransport(rest)
+        else:
+            raise ValueError("Unknown transport for address: {}".format(address))
 
-                elif isinstance(elm, Snake):
-                    self._draw_pixel(frame, x, y, AuraboxUI.GREEN)
-                    pass
+    def connect(self):
+        raise NotImplementedError()
 
-                else:
-                    # Shouldn't happen.
-                    print ("- BAD: ({},{}) -> {}".format(x, y, elm))
-        return bytearray(frame)
+    def send(self, *buffers):
+        raise NotImplementedError()
 
-    def _draw_pixel(self, frame, x, y, colour):
-        """
-        Draws a pixel to the raw buffer.
-        """
-        
-        # The highest nibble translates to the second position, as follows:
-        # XY => Y = screen[0], X = screen[1]
-        pos = (x // 2) + (y * AuraboxUI.DIMENSIONS[0] // 2)
-        value = colour << 4 if (x % 2) else colour
-        frame[ pos ] = (frame[ pos ] | value)
- 
+    def close(self):
+        if self._sock is not None:
+            sock, self._sock = self._sock, None
+            sock.close()
 
-    def _build_raw_frame(self, payload):
+    def _finish(self, sent, buffers, write):
         """
-        Builds a full frame with the provided payload
+        Writes whatever a vectored write didn't manage to, if anything. Nothing gets copied: what's left of the
+        buffers goes out through views of them.
         """
-        header = img_header()
-        bin_data = header + payload
-        bin_data = bin_data + checksum(bin_data[1:])
-        bin_data.append(0x02)
+        if sent >= sum(map(len, buffers)):
+            return
+
+        for buffer in buffers:
+            if sent >= len(buffer):
+                sent -= len(buffer)
+                continue
+
+            rest = memoryview(buffer)[sent:]
+            sent = 0
+            while rest:
+                rest = rest[write(rest):]
+
+class SocketTransport(Transport):
+    def __init__(self, family, address):
+        super(SocketTransport, self).__init__()
+        self._family = family
+        self._address = address
+
+    def connect(self):
+        self.close()
+        self._sock = socket.socket(self._family, socket.SOCK_STREAM)
+        self._sock.connect(self._address)
+        return self
+
+    def send(self, *buffers):
+        sent = self._sock.sendmsg(buffers)
+        self._finish(sent, buffers, self._sock.send)
+
+class TcpTransport(SocketTransport):
+    def __init__(self, host, port):
+        super(TcpTransport, self).__init__(socket.AF_INET, (host, port))
+
+    def connect(self):
+        super(TcpTransport, self).connect()
+        # Frames are tiny, and we want them out right away.
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return self
+
+class UnixTransport(SocketTransport):
+    def __init__(self, path):
+        super(UnixTransport, self).__init__(socket.AF_UNIX, path)
+
+class FileTransport(Transport):
+    """
+    Appends frames to a file, or writes them to a named pipe.
+    """
+    def __init__(self, path):
+        super(FileTransport, self).__init__()
+        self._path = path
+        self._fd = None
 
-        # Writing to output buffer
-        return escape_message(bin_data)
-    
+    def connect(self):
+        self.close()
+        self._fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        return self
+
+    def send(self, *buffers):
+        sent = os.writev(self._fd, buffers)
+        self._finish(sent, buffers, lambda data: os.write(self._fd, data))
+
+    def close(self):
+        if self._fd is not None:
+            fd, self._fd = self._fd, None
+            os.close(fd)
+
+class RfcommTransport(Transport):
+    """
+    The actual device, over bluetooth.
+    """
+    def __init__(self, addr):
+        super(RfcommTransport, self).__init__()
+        self._addr = addr
+
+    def connect(self):
+        from bluetooth import find_service, BluetoothSocket, RFCOMM
+        self.close()
+
+        service_matches = find_service( address = self._addr )
+        if len(service_matches) == 0:
+            raise ConnectionError("Couldn't find the SPP service.")
+
+        first_match = service_matches[0]
+        port = first_match["port"]
+        host = first_match["host"]
+
+        # Create the client socket
+        self._sock = BluetoothSocket( RFCOMM )
+        self._sock.connect((host, port))
+        return self
+
+    def send(self, *buffers):
+        # No vectored writes over bluetooth sockets.
+        self._sock.sendall(b"".join(buffers))
+
+# ----------------------------------------------------
+class FrameEncoder():
+    """
+    Turns payloads into frames the Aurabox understands: a start byte, the length, the image command, the payload, a
+    checksum of it all and an end byte. Anything in between that could be mistaken for a start, end or escape byte is
+    escaped.
+
+    Frames are written to the same buffer over and over, the header being written (and summed up) once and for all, so
+    the memoryview `encode` returns is only good until the next call.
+    """
+    START, END, ESCAPE = 0x01, 0x02, 0x03
+
+    # 10x10 pixels, 4 bits each.
+    IMAGE_HEADER = bytes([0x44, 0x00, 0x0A, 0x0A, 0x04])
+
+    # What follows the escape byte in place of each byte value, or 0 for those going out as they are: 0x01, 0x02 and
+    # 0x03 become 0x03 0x04, 0x03 0x05 and 0x03 0x06.
+    ESCAPE_TABLE = bytes([0x00, 0x04, 0x05, 0x06]) + bytes(252)
+
+    def __init__(self, payload_size = 50):
+        # The length accounts for the checksum as well.
+        length = len(FrameEncoder.IMAGE_HEADER) + payload_size + 2
+        header = bytes([length & 0xFF, length >> 8]) + FrameEncoder.IMAGE_HEADER
+
+        # Worst case, everything but the start and end bytes gets escaped.
+        self._buffer = bytearray((len(header) + payload_size + 2) * 2 + 2)
+        self._buffer[0] = FrameEncoder.START
+        self._view = memoryview(self._buffer)
+        self._prefix_size = self._write(1, header)
+        self._header_sum = sum(header)
+        self._payload_size = payload_size
+
+    def encode(self, payload):
+        if len(payload) != self._payload_size:
+            raise ValueError("Invalid payload size: {}, expected {}.".format(len(payload), self._payload_size))
+
+        end = self._write(self._prefix_size, payload)
+        checksum = (self._header_sum + sum(payload)) & 0xFFFF
+        end = self._write_escaped(end, (checksum & 0xFF, checksum >> 8))
+
+        self._buffer[end] = FrameEncoder.END
+        return self._view[:end + 1]
+
+    def _write(self, offset, data):
+        """
+        Writes the bytes given into the buffer from the offset on, escaping whatever needs to be. Returns where they
+        ended.
+        """
+        # Most bytes go as they are, and a payload with nothing to escape goes in one go.
+        if FrameEncoder.START not in data and FrameEncoder.END not in data and FrameEncoder.ESCAPE not in data:
+            end = offset + len(data)
+            self._view[offset:end] = data
+            return end
+        return self._write_escaped(offset, data)
+
+    def _write_escaped(self, offset, data):
+        """
+        Same as `_write`, a byte at a time. Any iterable of byte values will do.
+        """
+        buffer, table = self._buffer, FrameEncoder.ESCAPE_TABLE
+        for byte in data:
+            escaped = table[byte]
+            if escaped:
+                buffer[offset] = FrameEncoder.ESCAPE
+                buffer[offset + 1] = escaped
+                offset += 2
+            else:
+                buffer[offset] = byte
+                offset += 1
+        return offset
+
+# ----------------------------------------------------
+class FrameSender():
+    """
+    Sends frames to a device from a thread of its own, so that a slow link never holds the game loop back.
+
+    There's room for a single frame waiting to go out: whenever a new one comes in before the previous one went out,
+    the latter is coalesced, that is, forgotten in favour of the latest. When a frame fails to go through, the sender
+    reconnects (as many times as needed) and tries again, unless a newer frame came in meanwhile, in which case the
+    failed one is dropped.
+
+    Frames get copied into a buffer of the sender's own, so callers can reuse theirs as soon as `submit` returns. That
+    buffer and the one going out are swapped whenever it's the turn of the next frame.
+
+    `connect` is called from the sender thread, and must return something with `send` and `close`.
+    """
+    def __init__(self, connect, delay = 0, retry_delay = 1.0):
+        self._connect = connect
+        self._delay = delay
+        self._retry_delay = retry_delay
+
+        self._lock = threading.Condition()
+        self._pending = bytearray()
+        self._outgoing = bytearray()
+        self._has_frame = False
+        self._submitted = 0
+        self._running = True
+
+        self._sent = 0
+        self._dropped = 0
+        self._coalesced = 0
+        self._reconnects = 0
+        self._last_error = None
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+        self._thread = threading.Thread(target = self._run, name = "FrameSender", daemon = True)
+        self._thread.start()
+
+    def submit(self, frame):
+        """
+        Queues the frame to be sent, replacing whichever frame was waiting to be.
+        """
+        with self._lock:
+            if self._has_frame:
+                self._coalesced += 1
+            self._pending[:] = frame
+            self._has_frame = True
+            self._submitted = time.perf_counter()
+            self._lock.notify()
+
+    def stats(self):
+        """
+        Counters for the frames so far, along with how long it took them (in seconds) to go out once submitted, and
+        why the last frame that didn't go through failed, if any did.
+        """
+        with self._lock:
+            return {
+                "sent": self._sent,
+                "dropped": self._dropped,
+                "coalesced": self._coalesced,
+                "reconnects": self._reconnects,
+                "last_error": self._last_error,
+                "latency_mean": self._latency_total / self._sent if self._sent else 0.0,
+                "latency_max": self._latency_max,
+            }
+
+    def close(self, timeout = None):
+        with self._lock:
+            self._running = False
+            self._lock.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        sock = None
+        while True:
+            with self._lock:
+                while not self._has_frame and self._running:
+                    self._lock.wait()
+                if not self._running:
+                    break
+                self._pending, self._outgoing = self._outgoing, self._pending
+                self._has_frame = False
+                submitted = self._submitted
+
+            try:
+                if sock is None:
+                    sock = self._connect()
+                sock.send(self._outgoing)
+            except Exception as e:
+                with self._lock:
+                    self._reconnects += 1
+                    self._last_error = repr(e)
+                    if not self._has_frame:
+                        self._pending, self._outgoing = self._outgoing, self._pending
+                        self._has_frame = True
+                        self._submitted = submitted
+                    else:
+                        self._dropped += 1
+                if sock is not None:
+                    self._close_quietly(sock)
+                    sock = None
+                time.sleep(self._retry_delay)
+                continue
+
+            latency = time.perf_counter() - submitted
+            with self._lock:
+                self._sent += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+
+            # Give the device some time to digest the frame.
+            if self._delay:
+                time.sleep(self._delay)
+
+        if sock is not None:
+            self._close_quietly(sock)
+
+    def _close_quietly(self, sock):
+        try:
+            sock.close()
+        except Exception:
+            pass
+
+class AuraboxUI():
+    # Empirically determined those values to be from 0 to 7.
+    BLACK, RED, GREEN, YELLOW, DARK_BLUE, PURPLE, LIGHT_BLUE, WHITE = range(8)
+    
+    DIMENSIONS = (10, 10)
+
+    # Colour of each kind of element, indexed by the kind itself.
+    PALETTE = (BLACK, GREEN, RED, BLACK)
+
+    # TODO: Check how this behaves with the FPS!
+    FRAME_DELAY = 0.05
+
+    # The box doesn't need refreshing as often as a window does.
+    FPS = 10
+
+    def __init__(self, addr):
+        # Either a transport, or an address to make one from.
+        self._transport = addr if isinstance(addr, Transport) else Transport.for_address(addr)
+
+        # Connecting, sending and reconnecting happens away from the game loop.
+        self._sender = FrameSender(self._transport.connect, AuraboxUI.FRAME_DELAY)
+        self._out_buffer = []        
+
+        self._palette = numpy.array(AuraboxUI.PALETTE, dtype = numpy.uint8)
+        self._pixels = numpy.zeros(AuraboxUI.DIMENSIONS, dtype = numpy.uint8)
+        self._encoder = FrameEncoder(AuraboxUI.DIMENSIONS[0] * AuraboxUI.DIMENSIONS[1] // 2)
+
+        # The device keeps showing whatever it got last, so there's no point in sending it again.
+        self._last_payload = None
+        pass
+
+    def draw(self, space):
+        payload = self._build_payload(space)
+        if payload is not None and payload != self._last_payload:
+            raw_frame = self._build_raw_frame(payload)
+            self._send_frame(raw_frame)
+            self._last_payload = payload
+
+        pass
+
+    def _build_payload(self, space):
+        """
+        Buils an Aurabox-like payload from a given space
+        """
+
+        # A payload is represented by 50 bytes, with each nibble representing a pixel.
+        # A byte represents consecutive elements on a row.
+
+        # Like Rolling Stones, let's paint it black first. Whatever doesn't fit in the box is left out.
+        width = min(space.shape[0], AuraboxUI.DIMENSIONS[0])
+        height = min(space.shape[1], AuraboxUI.DIMENSIONS[1])
+        self._pixels.fill(AuraboxUI.BLACK)
+        self._pixels[:width, :height] = self._palette[space.region(0, 0, width, height)]
+
+        # The highest nibble translates to the second position, as follows:
+        # XY => Y = screen[0], X = screen[1]
+        packed = self._pixels[0::2] | (self._pixels[1::2] << 4)
+
+        # Bytes go row by row, hence the transposition.
+        return bytearray(packed.T.tobytes())
+
+    def _build_raw_frame(self, payload):
+        """
+        Builds a full frame with the provided payload. Mind that it's only valid until the next frame gets built.
+        """
+        return self._encoder.encode(payload)
+    
     def _send_frame(self, raw_frame):
         """
-        Sends the raw frame provided through the socket
+        Hands the raw frame provided over to the sender. It doesn't wait for it to go through the socket.
+        """
+        self._sender.submit(raw_frame)
+
+    def stats(self):
+        return self._sender.stats()
+
+    def close(self):
+        self._sender.close()
+
+
+# ----------------------------------------------------
+class SpectatorUI():
+    """
+    Streams the game to whoever connects over TCP (localhost, by default), for dashboards and the like to watch.
+
+    Every message starts with HEADER: its type, the frame it belongs to, the size of the space and how many cells
+    follow. A keyframe carries the kind of every cell (column after column, as in Space.kinds), a delta only the
+    cells that changed since the previous frame, as CELL records. Everyone gets a keyframe every `keyframe_every`
+    frames, and when they connect.
+
+    The game never waits for spectators. One whose connection can't keep up (more than `high_water` bytes waiting to
+    go out) misses frames, and catches up on the next keyframe once it has drained: deltas are no good to it anymore.
+    Keyframes are only built when someone needs one, so most frames cost a diff and a few bytes per spectator.
+    """
+    KEYFRAME, DELTA = range(0, 2)
+    HEADER = struct.Struct("<BIHHI")
+    CELL = numpy.dtype([("x", "<u2"), ("y", "<u2"), ("kind", "u1")])
+
+    class Client():
+        __slots__ = ("transport", "needs_keyframe")
+
+        def __init__(self, transport):
+            self.transport = transport
+            self.needs_keyframe = True
+
+    def __init__(self, port = 7878, host = "127.0.0.1", keyframe_every = 100, high_water = 64 * 1024):
+        import asyncio
+        self._keyframe_every = keyframe_every
+        self._high_water = high_water
+
+        # What spectators have been told so far, to diff the space against.
+        self._shadow = None
+        self._frame = 0
+        self._keyframe_wanted = True
+
+        self._clients = set()
+        self._sent = 0
+        self._skipped = 0
+
+        # The server lives in a thread of its own, with its own loop. The game only ever hands it messages.
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._serve, host, port))
+        self._thread = threading.Thread(target = self._loop.run_forever, daemon = True)
+        self._thread.start()
+
+    @property
+    def port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    def invalidate(self):
+        """
+        Sends everyone a keyframe with the next frame.
+        """
+        self._shadow = None
+
+    def draw(self, space):
+        kinds = space.region(0, 0, *space.shape)
+        frame = self._frame
+        self._frame += 1
+
+        if self._shadow is None or self._shadow.shape != kinds.shape:
+            self._shadow = kinds.copy()
+            keyframe = self._build_keyframe(frame, kinds)
+            self._loop.call_soon_threadsafe(self._broadcast, keyframe, keyframe)
+            return
+
+        # Usually just the head, the tail and the edible.
+        changed = numpy.nonzero(kinds != self._shadow)
+        cells = numpy.empty(len(changed[0]), dtype = SpectatorUI.CELL)
+        cells["x"], cells["y"] = changed
+        cells["kind"] = kinds[changed]
+        self._shadow[changed] = cells["kind"]
+        delta = SpectatorUI.HEADER.pack(SpectatorUI.DELTA, frame, kinds.shape[0], kinds.shape[1], len(cells)) + cells.tobytes()
+
+        keyframe = None
+        if self._keyframe_wanted or frame % self._keyframe_every == 0:
+            keyframe = self._build_keyframe(frame, kinds)
+        if frame % self._keyframe_every == 0:
+            delta = keyframe
+        self._loop.call_soon_threadsafe(self._broadcast, delta, keyframe)
+
+    def stats(self):
+        return {
+            "clients": len(self._clients),
+            "sent": self._sent,
+            "skipped": self._skipped,
+        }
+
+    def close(self):
+        import asyncio
+
+        def stop():
+            self._server.close()
+            # Whatever they haven't been sent yet won't be: closing would wait for it to go out first, and slow
+            # spectators could hold us up for good.
+            for client in self._clients:
+                client.transport.abort()
+            self._loop.stop()
+
+        self._loop.call_soon_threadsafe(stop)
+        self._thread.join()
+
+        # Spectators still being served just need to notice they've been let go. Anyone who hasn't by then gets
+        # cancelled, so that no task outlives the loop.
+        tasks = asyncio.all_tasks(self._loop)
+        if tasks:
+            _, pending = self._loop.run_until_complete(asyncio.wait(tasks, timeout = 1.0))
+            for task in pending:
+                task.cancel()
+            if pending:
+                self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions = True))
+        self._loop.close()
+
+    def _build_keyframe(self, frame, kinds):
+        self._keyframe_wanted = False
+        return SpectatorUI.HEADER.pack(SpectatorUI.KEYFRAME, frame, kinds.shape[0], kinds.shape[1], kinds.size) + kinds.tobytes()
+
+    def _broadcast(self, delta, keyframe):
+        """
+        Runs on the server's loop. Hands the frame over to every spectator able to take it.
         """
+        for client in self._clients:
+            transport = client.transport
+            if transport.is_closing():
+                continue
+
+            # Too far behind: whatever comes next is of no use until it gets a keyframe.
+            if transport.get_write_buffer_size() > self._high_water:
+                client.needs_keyframe = True
+                self._keyframe_wanted = True
+                self._skipped += 1
+                continue
+
+            if not client.needs_keyframe:
+                transport.write(delta)
+            elif keyframe is not None:
+                transport.write(keyframe)
+                client.needs_keyframe = False
+            else:
+                self._keyframe_wanted = True
+                self._skipped += 1
+                continue
+            self._sent += 1
+
+    async def _serve(self, reader, writer):
+        client = SpectatorUI.Client(writer.transport)
+        self._clients.add(client)
+        self._keyframe_wanted = True
         try:
-            self._sock.send(bytes(raw_frame))
-            sleep(AuraboxUI.FRAME_DELAY)
-        except Exception as e:
-            print("Horrendous error whilst trying to send the frame to the device: ", e)
-            sys.exit(1)
+            # Spectators have nothing to say. Just wait for them to leave.
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+
+class SpectatorView():
+    """
+    The other end of SpectatorUI: feed it whatever comes out of the connection, and `kinds` follows the game.
+    """
+    def __init__(self):
+        self.kinds = None
+        self.frame = None
+        self._buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Applies every complete message in the data (and whatever was left over from before). Returns how many.
+        """
+        self._buffer += data
+        header = SpectatorUI.HEADER
+        applied = 0
+        offset = 0
+        while len(self._buffer) - offset >= header.size:
+            kind, frame, width, height, count = header.unpack_from(self._buffer, offset)
+            size = count if kind == SpectatorUI.KEYFRAME else count * SpectatorUI.CELL.itemsize
+            if len(self._buffer) - offset - header.size < size:
+                break
+
+            body = bytes(self._buffer[offset + header.size:offset + header.size + size])
+            if kind == SpectatorUI.KEYFRAME:
+                self.kinds = numpy.frombuffer(body, dtype = numpy.uint8).reshape(width, height).copy()
+            elif self.kinds is not None:
+                cells = numpy.frombuffer(body, dtype = SpectatorUI.CELL)
+                self.kinds[cells["x"], cells["y"]] = cells["kind"]
+
+            self.frame = frame
+            offset += header.size + size
+            applied += 1
+
+        del self._buffer[:offset]
+        return applied
+
+# ----------------------------------------------------
+class SnakeEngine():
+    """
+    The game on its own: no pygame, no clocks, no printing. It moves forward a tick at a time, whenever `step` is
+    called, so it can be simulated as fast as the CPU allows.
+
+    `step` returns (state, reward, done, info), the state being the kind of element on every cell of the space. Mind
+    that the state is updated in place by the following steps, so copy it if you need to keep it around.
+
+    Worlds too large for a dense grid can be played on a SparseSpace instead, by passing it as `space_type`. There's
+    no array of every cell to hand out then, so the state is the space itself: see its `region` method.
+
+    Games can be forked: `clone` gives an independent copy which shares the space with this one until either moves,
+    and `snapshot` packs the whole game in a single buffer (SNAPSHOT_HEADER, then the random generator, the free cell
+    index, the body of the snake from tail to head and the space itself) which `restore` brings back.
+    """
+    REWARD_EDIBLE = 1
+    REWARD_GAME_OVER = -1
+
+    # Magic, width, height, seed, ticks, score, free cells, direction, cause, length, head, edible (where it is and
+    # where it's going), whether it's placed, random generator version and its gaussian (NaN if none).
+    SNAPSHOT_MAGIC = b"SNKS"
+    SNAPSHOT_HEADER = struct.Struct("<4sIIqqqqBBIiiiiii?Bd")
+    SNAPSHOT_RANDOM = 625
+
+    def __init__(self, dimensions = SPACE_DIMENSIONS, quantum = SPACE_QUANTUM, border_width = SPACE_BORDER_WIDTH, seed = None, record = False, stats = None, space_type = Space):
+        self._dimensions = dimensions
+        self._quantum = quantum
+        self._border_width = border_width
+        self._space_type = space_type
+
+        # TickStats to time the snake and the edible with, if any.
+        self._stats = stats
+        self.reset(seed, record)
+
+    @property
+    def space(self):
+        return self._space
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @property
+    def head(self):
+        return self._snake.head
+
+    @property
+    def tail(self):
+        return self._snake.tail
+
+    @property
+    def edible(self):
+        return tuple(self._edible.position)
+
+    @property
+    def done(self):
+        return self._game_over is not None
+
+    @property
+    def seed(self):
+        return self._seed
+
+    @property
+    def replay(self):
+        """
+        The recording of the current game, if it's being recorded.
+        """
+        return self._replay
+
+    @staticmethod
+    def is_movement_valid(current_dir, proposed_dir):
+        """
+        Same rules as ever: the snake can go anywhere, except straight back onto itself.
+        """
+        return proposed_dir != (current_dir + 2) % 4
+
+    def reset(self, seed = None, record = False):
+        """
+        Starts a brand new game. Games reset with the same seed play out the same way, so recording one is just a
+        matter of keeping the seed and the direction taken on every tick.
+        """
+        # Any randomness comes from here, so we better know where it started.
+        self._seed = seed if seed is not None else random.getrandbits(63)
+        self._random = random.Random(self._seed)
+        self._replay = Replay(self._seed, self._dimensions, self._quantum, self._border_width, self._space_type) if record else None
+        self._space = self._space_type(self._dimensions, self._quantum, self._border_width, self._random)
+        self._game = SnakeGame.Logic(self._space)
+
+        # Snake expects a list of positions, even though the list is one.
+        self._direction = KeyPress.DOWN
+        self._snake = Snake([[4, 0]], self._direction)
+        self._edible = Edible([1, 0])
+        self._snake.place(self._game)
+        self._edible.update(self._game)
+
+        self._ticks = 0
+        self._score = 0
+        self._game_over = None
+        return self._state()
+
+    def step(self, action = None):
+        """
+        Advances the game a tick, heading to the given direction (or carrying on, if None or not allowed).
+        """
+        if self._game_over is not None:
+            raise ValueError("The game is over. Reset it before stepping again.")
+
+        if action is not None:
+            proposed = action.value if isinstance(action, KeyPress) else action
+            if not KeyPress.is_valid(proposed):
+                raise ValueError("Invalid action provided: {}".format(action))
+            if SnakeEngine.is_movement_valid(self._direction, proposed):
+                self._direction = proposed
+
+        if self._replay is not None:
+            self._replay.record(self._direction)
+
+        stats = self._stats
+        if stats is not None:
+            start = time.perf_counter()
+
+        reward = 0
+        length = len(self._snake)
+        try:
+            self._snake.update(self._game, self._direction)
+            if len(self._snake) > length:
+                self._score += 1
+                reward = SnakeEngine.REWARD_EDIBLE
+        except GameOver as e:
+            self._game_over = e
+            reward = SnakeEngine.REWARD_GAME_OVER
+
+        if stats is not None:
+            snake_done = time.perf_counter()
+            stats.record("snake", snake_done - start)
+
+        self._edible.update(self._game)
+        self._ticks += 1
+
+        if stats is not None:
+            stats.record("edible", time.perf_counter() - snake_done)
+        return self._state(), reward, self._game_over is not None, self.info()
+
+    def info(self):
+        return {
+            "score": self._score,
+            "length": len(self._snake),
+            "ticks": self._ticks,
+            "cause": self._game_over,
+        }
+
+    def clone(self):
+        """
+        An independent copy of the game, as it is. The space is only copied once either game changes it, and then
+        only by whichever does.
+        """
+        clone = copy.copy(self)
+        clone._random = random.Random()
+        clone._random.setstate(self._random.getstate())
+
+        clone._snake = copy.copy(self._snake)
+        clone._snake._body = self._snake._body.copy()
+        clone._edible = copy.copy(self._edible)
+        clone._space = self._space.clone(clone._random, {self._snake: clone._snake, self._edible: clone._edible})
+        clone._game = SnakeGame.Logic(clone._space)
+        clone._replay = copy.deepcopy(self._replay)
+        return clone
+
+    def snapshot(self, path = None, buffer = None):
+        """
+        Packs the game in a buffer, which `restore` takes back. Given a path, the buffer is a file mapped in memory.
+        Given a buffer large enough, that one gets reused rather than making a new one. Recordings aren't part of it.
+        """
+        space, snake, edible = self._space, self._snake, self._edible
+        if not isinstance(space, Space):
+            raise ValueError("Only dense spaces can be packed in a snapshot. Giving up.")
+
+        cells = space._cells.size
+        header, offsets, size = self._snapshot_layout(space.shape, len(snake))
+        if path is not None:
+            buffer = self._map(path, size)
+        elif buffer is None or len(buffer) < size:
+            buffer = bytearray(size)
+
+        version, state, gauss = self._random.getstate()
+        cause = BatchedSnakeEngine.CAUSES.index(type(self._game_over)) if self._game_over is not None else BatchedSnakeEngine.ALIVE
+        header.pack_into(buffer, 0, SnakeEngine.SNAPSHOT_MAGIC, space.shape[0], space.shape[1], self._seed, self._ticks,
+                         self._score, space._free_count, self._direction, cause, len(snake), snake.head[0], snake.head[1],
+                         edible._position[0], edible._position[1], edible._new_position[0], edible._new_position[1],
+                         edible._placed, version, gauss if gauss is not None else float("nan"))
+
+        sections = self._snapshot_sections(buffer, offsets, cells, len(snake))
+        sections[0][...] = state
+        sections[1][...] = space._free
+        sections[2][...] = space._slots
+        sections[3][...] = numpy.roll(snake._body, -snake._tail, axis = 0)[:len(snake)]
+        sections[4][...] = space._cells
+        sections[5][...] = space._kinds
+        return buffer
+
+    def restore(self, snapshot):
+        """
+        Brings the game back to how it was when the snapshot (a buffer, or the path to one) was taken.
+        """
+        if isinstance(snapshot, str):
+            snapshot = self._map(snapshot)
+
+        space, snake, edible = self._space, self._snake, self._edible
+        header = SnakeEngine.SNAPSHOT_HEADER
+        (magic, width, height, seed, ticks, score, free_count, direction, cause, length, head_x, head_y,
+         edible_x, edible_y, new_x, new_y, placed, version, gauss) = header.unpack_from(snapshot, 0)
+        if magic != SnakeEngine.SNAPSHOT_MAGIC:
+            raise ValueError("Not a snapshot. Cannot proceed.")
+        if not isinstance(space, Space) or (width, height) != space.shape:
+            raise ValueError("Snapshot of a {}x{} space, which this game isn't. Cannot proceed.".format(width, height))
+
+        if space._owners[0] > 1:
+            space._own()
+        sections = self._snapshot_sections(snapshot, self._snapshot_layout(space.shape, length)[1], space._cells.size, length)
+
+        self._random.setstate((version, tuple(sections[0].tolist()), None if gauss != gauss else gauss))
+        space._free[...] = sections[1]
+        space._slots[...] = sections[2]
+        space._cells[...] = sections[4]
+        space._kinds[...] = sections[5]
+        space._free_count = free_count
+
+        if len(snake._body) < length:
+            snake._body = numpy.empty((length, 2), dtype = numpy.int32)
+        snake._body[:length] = sections[3]
+        snake._tail = 0
+        snake._length = length
+        snake._head = (head_x, head_y)
+
+        edible._position = [edible_x, edible_y]
+        edible._new_position = [new_x, new_y]
+        edible._placed = placed
+
+        self._seed = seed
+        self._ticks = ticks
+        self._score = score
+        self._direction = direction
+        game_over = BatchedSnakeEngine.CAUSES[cause]
+        self._game_over = game_over("Restored from a snapshot. Game Over!") if game_over is not None else None
+        return self._state()
+
+    def _state(self):
+        # Looked up every time, as a cloned space swaps its arrays for copies of its own on the first write.
+        return self._space.kinds if isinstance(self._space, Space) else self._space
+
+    def _snapshot_layout(self, shape, length):
+        """
+        The header, where each section starts, and how large the whole lot is. Sections are kept 8 bytes aligned.
+        """
+        align = lambda offset: (offset + 7) & ~7
+        cells = shape[0] * shape[1]
+        sizes = (SnakeEngine.SNAPSHOT_RANDOM * 4, cells * 4, cells * 4, length * 8, cells * 2, cells)
+
+        offsets = []
+        offset = align(SnakeEngine.SNAPSHOT_HEADER.size)
+        for size in sizes:
+            offsets.append(offset)
+            offset = align(offset + size)
+        return SnakeEngine.SNAPSHOT_HEADER, offsets, offset
+
+    def _snapshot_sections(self, buffer, offsets, cells, length):
+        shape = self._space.shape
+        view = lambda i, dtype, count: numpy.frombuffer(buffer, dtype = dtype, count = count, offset = offsets[i])
+        return (
+            view(0, numpy.uint32, SnakeEngine.SNAPSHOT_RANDOM),
+            view(1, numpy.int32, cells),
+            view(2, numpy.int32, cells),
+            view(3, numpy.int32, length * 2).reshape(length, 2),
+            view(4, numpy.int16, cells).reshape(shape),
+            view(5, numpy.uint8, cells).reshape(shape),
+        )
+
+    @staticmethod
+    def _map(path, size = None):
+        """
+        Maps the file in memory: a new one of the given size, or an existing one to be read.
+        """
+        import mmap
+        with open(path, "w+b" if size is not None else "rb") as f:
+            if size is not None:
+                f.truncate(size)
+                return mmap.mmap(f.fileno(), size)
+            return mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+
+# ----------------------------------------------------
+class Replay():
+    """
+    A game, as recorded by SnakeEngine: its seed, and the direction the snake took on every tick.
+
+    Directions take 2 bits, and are stored in runs: each byte holds a direction in its 2 highest bits, and how many
+    ticks in a row (minus one, up to 64) the snake kept going that way in the rest.
+    """
+    MAGIC = b"SNKR"
+    VERSION = 2
+
+    # Magic, version, seed, dimensions, quantum, border width, ticks and the type of space, by version. The first one
+    # only had room for 16 bit sizes and unsigned seeds, and dense spaces.
+    HEADERS = {1: struct.Struct("<4sBQHHHHI"), 2: struct.Struct("<4sBqIIIIQB")}
+    HEADER = HEADERS[VERSION]
+    MAX_RUN = 64
+
+    # Spaces pick their random cells each their own way, so the same seed only gives the same game on the same type.
+    SPACE_TYPES = (Space, SparseSpace)
+
+    def __init__(self, seed, dimensions = SPACE_DIMENSIONS, quantum = SPACE_QUANTUM, border_width = SPACE_BORDER_WIDTH,
+                 space_type = Space):
+        if space_type not in Replay.SPACE_TYPES:
+            raise ValueError("Can't record a game on a {}. Cannot proceed.".format(space_type.__name__))
+
+        # Better find out now than once the game is over and there's a replay to save.
+        try:
+            Replay.HEADER.pack(Replay.MAGIC, Replay.VERSION, seed, dimensions[0], dimensions[1], quantum, border_width, 0, 0)
+        except struct.error:
+            raise ValueError("Can't record a game with seed {}, dimensions {}, quantum {} and border {}: replays take "
+                             "64 bit seeds and 32 bit sizes. Cannot proceed.".format(seed, tuple(dimensions), quantum, border_width))
+
+        self._seed = seed
+        self._dimensions = tuple(dimensions)
+        self._quantum = quantum
+        self._border_width = border_width
+        self._space_type = space_type
+        self._runs = bytearray()
+        self._ticks = 0
+
+    def __len__(self):
+        return self._ticks
+
+    @property
+    def seed(self):
+        return self._seed
+
+    def record(self, direction):
+        # Carry on with the current run if we can, otherwise start a new one.
+        if self._runs:
+            last = self._runs[-1]
+            if last >> 6 == direction and (last & 0x3F) < Replay.MAX_RUN - 1:
+                self._runs[-1] = last + 1
+                self._ticks += 1
+                return
+
+        self._runs.append(direction << 6)
+        self._ticks += 1
+
+    def directions(self):
+        """
+        Yields the direction of every tick, in order.
+        """
+        for run in self._runs:
+            direction = run >> 6
+            for _ in range((run & 0x3F) + 1):
+                yield direction
+
+    def engine(self):
+        """
+        A fresh engine, ready to go through the same game again.
+        """
+        return SnakeEngine(self._dimensions, self._quantum, self._border_width, self._seed, space_type = self._space_type)
+
+    def play(self, engine = None):
+        """
+        Goes through the whole game, as fast as it goes, returning the engine as the game ended.
+        """
+        engine = engine if engine is not None else self.engine()
+        for direction in self.directions():
+            engine.step(direction)
+        return engine
+
+    def to_bytes(self):
+        header = Replay.HEADER.pack(Replay.MAGIC, Replay.VERSION, self._seed, self._dimensions[0], self._dimensions[1],
+                                    self._quantum, self._border_width, self._ticks, Replay.SPACE_TYPES.index(self._space_type))
+        return header + bytes(self._runs)
+
+    @staticmethod
+    def from_bytes(data):
+        header = Replay.HEADERS.get(data[4]) if len(data) > 4 else None
+        if header is None or bytes(data[:4]) != Replay.MAGIC:
+            raise ValueError("Not a replay, or not one we can read.")
+
+        fields = header.unpack_from(data)
+        magic, version, seed, width, height, quantum, border_width, ticks = fields[:8]
+        space_type = fields[8] if len(fields) > 8 else 0
+        if space_type >= len(Replay.SPACE_TYPES):
+            raise ValueError("Replay of a game on an unknown type of space ({}). Cannot proceed.".format(space_type))
+
+        replay = Replay(seed, (width, height), quantum, border_width, Replay.SPACE_TYPES[space_type])
+        replay._runs = bytearray(data[header.size:])
+        replay._ticks = ticks
+        return replay
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            return Replay.from_bytes(f.read())
+
+# ----------------------------------------------------
+class ReplayPlayer():
+    """
+    Plays a replay back, and seeks through it. A snapshot of the game is kept every `snapshot_every` ticks on the way,
+    so going back to any tick only means replaying from the closest snapshot before it. Sparse spaces don't go in
+    snapshots, so games on them keep clones instead, and seeking back replaces the engine with a clone of one.
+    """
+    def __init__(self, replay, snapshot_every = 1000):
+        self._replay = replay
+        self._snapshot_every = snapshot_every
+        self._directions = list(replay.directions())
+        self._engine = replay.engine()
+        self._snapshots = {0: self._keyframe()}
+
+    @property
+    def engine(self):
+        return self._engine
+
+    @property
+    def tick(self):
+        return self._engine.info()["ticks"]
+
+    def seek(self, tick):
+        """
+        Brings the game to how it was right after the given tick.
+        """
+        tick = max(0, min(tick, len(self._directions)))
+        start = max(t for t in self._snapshots if t <= tick)
+        if not (start <= self.tick <= tick):
+            self._rewind(self._snapshots[start])
+
+        while self.tick < tick:
+            self.step()
+        return self._engine
+
+    def step(self):
+        """
+        Goes through the next tick, if there's any left.
+        """
+        current = self.tick
+        if current >= len(self._directions):
+            return False
+
+        self._engine.step(self._directions[current])
+        if (current + 1) % self._snapshot_every == 0 and current + 1 not in self._snapshots:
+            self._snapshots[current + 1] = self._keyframe()
+        return True
+
+    def _keyframe(self):
+        if isinstance(self._engine.space, Space):
+            return self._engine.snapshot()
+        return self._engine.clone()
+
+    def _rewind(self, keyframe):
+        if isinstance(keyframe, SnakeEngine):
+            self._engine = keyframe.clone()
+        else:
+            self._engine.restore(keyframe)
+
+# ----------------------------------------------------
+class BatchedSnakeEngine():
+    """
+    Many games at once, stepped together with a handful of numpy operations instead of a Python loop per game.
+
+    All boards live in a single (games, width * height) array of element kinds. Rather than keeping a body per snake,
+    every snake cell links to the cell ahead of it (towards the head) in `_next`, so moving a snake is just a matter
+    of following its tail's link. Games that end are started over on the spot.
+
+    `step` takes a direction per game (or -1 to carry on) and returns (state, reward, done, info), where the state is
+    a (games, width, height) view of the boards and `info` holds, per game, the score, length and ticks so far (or
+    the final ones, for the games that just ended) along with what ended them, as one of the causes below.
+    """
+    ALIVE, HIT_WALL, ATE_ITSELF, FILLED_SPACE = range(0, 4)
+
+    # The game over each of the causes above stands for.
+    CAUSES = (None, InvalidPositionGameOver, AteItselfGameOver, SpaceFilledGameOver)
+
+    # Same start as SnakeEngine.
+    START_POSITION = (4, 0)
+    START_DIRECTION = KeyPress.DOWN
+    START_EDIBLE = (1, 0)
+
+    def __init__(self, games, dimensions = SPACE_DIMENSIONS, quantum = SPACE_QUANTUM, border_width = SPACE_BORDER_WIDTH, seed = None):
+        self._shape = Space(dimensions, quantum, border_width).shape
+        self._size = self._shape[0] * self._shape[1]
+        self._games = games
+        self._rows = numpy.arange(games)
+
+        self._boards = numpy.zeros((games, self._size), dtype = numpy.uint8)
+        self._next = numpy.zeros((games, self._size), dtype = numpy.int32)
+        self._heads = numpy.zeros(games, dtype = numpy.int32)
+        self._tails = numpy.zeros(games, dtype = numpy.int32)
+        self._edibles = numpy.zeros(games, dtype = numpy.int32)
+        self._directions = numpy.zeros(games, dtype = numpy.int8)
+        self._lengths = numpy.zeros(games, dtype = numpy.int32)
+        self._scores = numpy.zeros(games, dtype = numpy.int32)
+        self._ticks = numpy.zeros(games, dtype = numpy.int64)
+
+        # Movement vectors, indexed by direction.
+        self._dx = numpy.array([v[0] for v in Snake.VECTORS], dtype = numpy.int32)
+        self._dy = numpy.array([v[1] for v in Snake.VECTORS], dtype = numpy.int32)
+
+        self.reset(seed)
+
+    @property
+    def games(self):
+        return self._games
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def boards(self):
+        return self._boards.reshape((self._games,) + self._shape)
+
+    def reset(self, seed = None):
+        """
+        Starts every game over.
+        """
+        self._random = numpy.random.default_rng(seed)
+        self._restart(self._rows)
+        return self.boards
+
+    def step(self, actions = None):
+        rows = self._rows
+        height = self._shape[1]
+
+        # Turn wherever asked to, unless it'd mean going straight back.
+        if actions is not None:
+            actions = numpy.asarray(actions)
+            turn = (actions >= 0) & (actions != (self._directions + 2) % 4)
+            self._directions = numpy.where(turn, actions, self._directions).astype(numpy.int8)
+
+        x, y = numpy.divmod(self._heads, height)
+        x = x + self._dx[self._directions]
+        y = y + self._dy[self._directions]
+
+        # Same rules as SnakeGame.Logic: walls and the snake itself (tail included) are deadly, edibles make it grow.
+        hit_wall = (x < 0) | (x >= self._shape[0]) | (y < 0) | (y >= height)
+        heads = numpy.where(hit_wall, 0, x * height + y).astype(numpy.int32)
+        target = self._boards[rows, heads]
+        ate_itself = ~hit_wall & (target == Element.SNAKE)
+        ate = ~hit_wall & (target == Element.EDIBLE)
+        filled = ate & (self._lengths + 1 == self._size)
+
+        causes = numpy.zeros(self._games, dtype = numpy.int8)
+        causes[hit_wall] = BatchedSnakeEngine.HIT_WALL
+        causes[ate_itself] = BatchedSnakeEngine.ATE_ITSELF
+        causes[filled] = BatchedSnakeEngine.FILLED_SPACE
+        done = causes != BatchedSnakeEngine.ALIVE
+        alive = ~done
+        ate &= alive
+
+        # Link the old heads to the new ones first, so that one-cell snakes find their way when the tail moves.
+        moved = rows[alive]
+        self._next[moved, self._heads[moved]] = heads[moved]
+
+        shrunk = rows[alive & ~ate]
+        tails = self._tails[shrunk]
+        self._boards[shrunk, tails] = Element.EMPTY
+        self._tails[shrunk] = self._next[shrunk, tails]
+
+        self._boards[moved, heads[moved]] = Element.SNAKE
+        self._heads[moved] = heads[moved]
+
+        self._lengths[ate] += 1
+        self._scores[ate] += 1
+        self._ticks += 1
+        self._spawn_edibles(rows[ate])
+
+        reward = numpy.zeros(self._games, dtype = numpy.int8)
+        reward[ate] = SnakeEngine.REWARD_EDIBLE
+        reward[done] = SnakeEngine.REWARD_GAME_OVER
+
+        info = {
+            "score": self._scores.copy(),
+            "length": self._lengths.copy(),
+            "ticks": self._ticks.copy(),
+            "cause": causes,
+        }
+
+        if done.any():
+            self._restart(rows[done])
+        return self.boards, reward, done, info
+
+    def _restart(self, rows):
+        height = self._shape[1]
+        start = BatchedSnakeEngine.START_POSITION[0] * height + BatchedSnakeEngine.START_POSITION[1]
+        edible = BatchedSnakeEngine.START_EDIBLE[0] * height + BatchedSnakeEngine.START_EDIBLE[1]
+
+        self._boards[rows] = Element.EMPTY
+        self._boards[rows, start] = Element.SNAKE
+        self._boards[rows, edible] = Element.EDIBLE
+        self._heads[rows] = start
+        self._tails[rows] = start
+        self._edibles[rows] = edible
+        self._directions[rows] = BatchedSnakeEngine.START_DIRECTION
+        self._lengths[rows] = 1
+        self._scores[rows] = 0
+        self._ticks[rows] = 0
+
+    def _spawn_edibles(self, rows):
+        """
+        Moves the edibles of the given games to a random free cell of their boards.
+        """
+        if len(rows) == 0:
+            return
+
+        # The free cell with the highest random key wins.
+        keys = self._random.random((len(rows), self._size))
+        keys[self._boards[rows] != Element.EMPTY] = -1
+        cells = keys.argmax(axis = 1).astype(numpy.int32)
+
+        self._boards[rows, cells] = Element.EDIBLE
+        self._edibles[rows] = cells
+
+# ----------------------------------------------------
+class Arena():
+    """
+    Lots of snakes, and lots of edibles, on a single board. Every head moves at once, and whatever happens to
+    them is sorted out in one go per tick, with a few numpy operations over the heads rather than the board.
+
+    As in BatchedSnakeEngine, the board is a flat array of element kinds, and every snake cell links to the cell
+    ahead of it in `_next`. The rules are those of the single game, for everyone at once:
+
+    - heads going off the board hit a wall,
+    - heads going into any snake cell (tails included, as they only move afterwards) hit a snake,
+    - heads meeting on the same cell hit each other, all of them, even when there's an edible in there,
+    - heads going into an edible eat it, and the edible shows up somewhere else.
+
+    Dead snakes leave the board, and get back on it somewhere free with `respawn`. It quacks enough like a Space
+    (shape, kinds and region) for the UIs to draw it.
+    """
+    ALIVE, HIT_WALL, HIT_SNAKE, HEAD_ON = range(0, 4)
+
+    # Rejection sampling gives up on free cells after that many rounds. Only a board about full could get there.
+    MAX_TRIES = 64
+
+    def __init__(self, snakes, edibles = None, dimensions = SPACE_DIMENSIONS, quantum = SPACE_QUANTUM, border_width = SPACE_BORDER_WIDTH,
+                 seed = None, respawn = False):
+        self._shape = ((dimensions[0] - border_width * 2) // quantum, (dimensions[1] - border_width * 2) // quantum)
+        self._size = self._shape[0] * self._shape[1]
+        self._snakes = snakes
+        self._edible_count = edibles if edibles is not None else snakes
+        if snakes + self._edible_count > self._size:
+            raise ValueError("Not enough room for {} snakes and {} edibles. Giving up.".format(snakes, self._edible_count))
+        self._respawn = respawn
+
+        self._board = numpy.zeros(self._size, dtype = numpy.uint8)
+        self._next = numpy.zeros(self._size, dtype = numpy.int32)
+        self._heads = numpy.zeros(snakes, dtype = numpy.int32)
+        self._tails = numpy.zeros(snakes, dtype = numpy.int32)
+        self._directions = numpy.zeros(snakes, dtype = numpy.int8)
+        self._lengths = numpy.zeros(snakes, dtype = numpy.int32)
+        self._scores = numpy.zeros(snakes, dtype = numpy.int32)
+        self._alive = numpy.zeros(snakes, dtype = bool)
+        self._ids = numpy.arange(snakes)
+
+        # Movement vectors, indexed by direction.
+        self._dx = numpy.array([v[0] for v in Snake.VECTORS], dtype = numpy.int32)
+        self._dy = numpy.array([v[1] for v in Snake.VECTORS], dtype = numpy.int32)
+
+        self.reset(seed)
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def kinds(self):
+        """
+        The kind of element on every cell, as a (width, height) view of the board. Meant to be read, not written.
+        """
+        return self._board.reshape(self._shape)
+
+    def region(self, x, y, width, height):
+        kinds = numpy.zeros((width, height), dtype = numpy.uint8)
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + width, self._shape[0]), min(y + height, self._shape[1])
+        if left < right and top < bottom:
+            kinds[left - x:right - x, top - y:bottom - y] = self.kinds[left:right, top:bottom]
+        return kinds
+
+    @property
+    def alive(self):
+        return self._alive
+
+    @property
+    def heads(self):
+        """
+        Where the head of every snake is, as (x, y) arrays. Dead snakes are wherever they died.
+        """
+        return numpy.divmod(self._heads, self._shape[1])
+
+    @property
+    def directions(self):
+        return self._directions
+
+    def reset(self, seed = None):
+        self._random = numpy.random.default_rng(seed)
+        self._board.fill(Element.EMPTY)
+        self._alive.fill(False)
+        self._scores.fill(0)
+        self._ticks = 0
+
+        self._spawn_snakes(self._ids)
+        self._board[self._free_cells(self._edible_count)] = Element.EDIBLE
+        return self.kinds
+
+    def step(self, actions = None):
+        """
+        Advances every snake a tick. Takes a direction per snake (or -1 to carry on), and returns (state, reward,
+        done, info): the board, then per snake the reward, whether it died on this tick, and in `info` the score,
+        length and what it died of (one of the causes above).
+        """
+        height = self._shape[1]
+        movers = self._ids[self._alive]
+
+        # Turn wherever asked to, unless it'd mean going straight back.
+        if actions is not None:
+            actions = numpy.asarray(actions)[movers]
+            current = self._directions[movers]
+            turn = (actions >= 0) & (actions != (current + 2) % 4)
+            self._directions[movers] = numpy.where(turn, actions, current)
+
+        directions = self._directions[movers]
+        x, y = numpy.divmod(self._heads[movers], height)
+        x = x + self._dx[directions]
+        y = y + self._dy[directions]
+
+        hit_wall = (x < 0) | (x >= self._shape[0]) | (y < 0) | (y >= height)
+        heads = numpy.where(hit_wall, 0, x * height + y).astype(numpy.int32)
+        target = self._board[heads]
+        hit_snake = ~hit_wall & (target == Element.SNAKE)
+
+        # Heads landing on the same cell: sort them, and look for neighbours that are equal.
+        head_on = numpy.zeros(len(movers), dtype = bool)
+        candidates = numpy.flatnonzero(~hit_wall)
+        order = candidates[numpy.argsort(heads[candidates], kind = "stable")]
+        same = heads[order[1:]] == heads[order[:-1]]
+        head_on[order[1:][same]] = True
+        head_on[order[:-1][same]] = True
+
+        causes = numpy.zeros(self._snakes, dtype = numpy.int8)
+        causes[movers[hit_wall]] = Arena.HIT_WALL
+        causes[movers[hit_snake]] = Arena.HIT_SNAKE
+        causes[movers[head_on & ~hit_snake]] = Arena.HEAD_ON
+
+        survives = ~(hit_wall | hit_snake | head_on)
+        ate = survives & (target == Element.EDIBLE)
+        survivors, heads = movers[survives], heads[survives]
+        dead = movers[~survives]
+
+        # Survivors move along: link the old heads to the new ones, let go of the tails unless they've eaten.
+        self._next[self._heads[survivors]] = heads
+        shrunk = movers[survives & ~ate]
+        self._board[self._tails[shrunk]] = Element.EMPTY
+        self._tails[shrunk] = self._next[self._tails[shrunk]]
+        self._board[heads] = Element.SNAKE
+        self._heads[survivors] = heads
+
+        eaters = movers[ate]
+        self._lengths[eaters] += 1
+        self._scores[eaters] += 1
+
+        self._remove_snakes(dead)
+        self._ticks += 1
+
+        # Eaten edibles turn up elsewhere, wherever there's room.
+        if len(eaters):
+            self._board[self._free_cells(len(eaters))] = Element.EDIBLE
+
+        reward = numpy.zeros(self._snakes, dtype = numpy.int8)
+        reward[eaters] = SnakeEngine.REWARD_EDIBLE
+        reward[dead] = SnakeEngine.REWARD_GAME_OVER
+        done = numpy.zeros(self._snakes, dtype = bool)
+        done[dead] = True
+
+        info = {
+            "score": self._scores.copy(),
+            "length": self._lengths.copy(),
+            "ticks": self._ticks,
+            "cause": causes,
+        }
+
+        if self._respawn and len(dead):
+            self._spawn_snakes(dead)
+        return self.kinds, reward, done, info
+
+    def _spawn_snakes(self, snakes):
+        """
+        Puts the given snakes on free cells, a cell long and heading anywhere.
+        """
+        cells = self._free_cells(len(snakes))
+        snakes = snakes[:len(cells)]
+        self._board[cells] = Element.SNAKE
+        self._heads[snakes] = cells
+        self._tails[snakes] = cells
+        self._directions[snakes] = self._random.integers(0, 4, len(snakes))
+        self._lengths[snakes] = 1
+        self._scores[snakes] = 0
+        self._alive[snakes] = True
+
+    def _remove_snakes(self, snakes):
+        """
+        Clears the bodies of the given snakes, all of them at once, walking from their tails to their heads.
+        """
+        self._alive[snakes] = False
+        cells, heads = self._tails[snakes], self._heads[snakes]
+        while len(cells):
+            self._board[cells] = Element.EMPTY
+            walking = cells != heads
+            cells, heads = self._next[cells[walking]], heads[walking]
+
+    def _free_cells(self, count):
+        """
+        Up to `count` distinct free cells at random. Picks cells at random until enough of them are free, which
+        doesn't take long while the board isn't crowded, and doesn't depend on how large it is.
+        """
+        found = numpy.zeros(0, dtype = numpy.int64)
+        for _ in range(Arena.MAX_TRIES):
+            if len(found) >= count:
+                break
+            picks = self._random.integers(0, self._size, (count - len(found)) * 2)
+            picks = picks[self._board[picks] == Element.EMPTY]
+            found = numpy.unique(numpy.concatenate((found, picks)))
+        return self._random.permutation(found)[:count].astype(numpy.int32)
+
+# ----------------------------------------------------
+class Autopilot():
+    """
+    Plays the game on its own: give it the engine, get back the direction to take.
+
+    Moves follow a distance field from the edible, grown a whole wavefront at a time with numpy. The field treats
+    the snake as it was when the field got computed, so it goes stale as the snake moves: it gets computed again
+    once the edible moves, once the way it shows to the edible runs into the snake, or once following it stops
+    getting us any closer (and whenever there's no way to the edible left on it).
+
+    Before taking a step, it makes sure the tail can still be reached from where the head lands, so that the snake
+    doesn't lock itself in. Unless it's been chasing its tail for twice as many ticks as there are cells without
+    eating anything: the edible is walled in by then, and going round once more won't change that.
+
+    All of that has to fit in `budget` seconds, if given any; past that, it goes for the closest move to the edible
+    that doesn't end the game right away, and carries on with the field on the next decision, from where it was left.
+
+    Works on dense spaces, as it reads the whole of them.
+    """
+    class Wavefront():
+        """
+        Breadth-first distances from a cell, a frontier at a time, which can be stopped and picked up again later.
+        The grid gets a border of walls and is flattened, so that neighbours are just a few offsets away.
+        """
+        __slots__ = ("stride", "open", "distances", "frontier", "distance", "offsets")
+
+        def __init__(self, passable, start):
+            width, height = passable.shape
+            self.stride = height + 2
+            padded = numpy.zeros((width + 2, height + 2), dtype = bool)
+            padded[1:-1, 1:-1] = passable
+
+            # Cells we could still get to, and how far the ones we got to are.
+            self.open = padded.ravel()
+            self.distances = numpy.full(self.open.size, -1, dtype = numpy.int32)
+
+            index = self.index(start)
+            self.open[index] = False
+            self.distances[index] = 0
+            self.frontier = numpy.array([index], dtype = numpy.int64)
+            self.distance = 0
+            self.offsets = numpy.array([-self.stride, self.stride, -1, 1], dtype = numpy.int64)
+
+        @property
+        def done(self):
+            return not len(self.frontier)
+
+        def index(self, cell):
+            return (cell[0] + 1) * self.stride + cell[1] + 1
+
+        def __getitem__(self, cell):
+            return self.distances[self.index(cell)]
+
+        def path(self, cell):
+            """
+            The way back to the start from a cell that got reached, as flat indices, the cell first and the start
+            last.
+            """
+            index = self.index(cell)
+            distance = self.distances[index]
+            path = [index]
+            while distance > 0:
+                distance -= 1
+                for offset in self.offsets.tolist():
+                    if self.distances[index + offset] == distance:
+                        index += offset
+                        break
+                path.append(index)
+            return numpy.array(path, dtype = numpy.int64)
+
+        def cells(self, indices):
+            return indices // self.stride - 1, indices % self.stride - 1
+
+        def expand(self, target = None, deadline = None, clock = time.perf_counter):
+            """
+            Grows until there's nowhere left to go, or the target gets reached. Returns False if the deadline went
+            by first.
+            """
+            target = self.index(target) if target is not None else None
+            while len(self.frontier):
+                if target is not None and self.distances[target] >= 0:
+                    return True
+                if deadline is not None and clock() > deadline:
+                    return False
+
+                neighbours = (self.frontier[:, None] + self.offsets).ravel()
+                neighbours = neighbours[self.open[neighbours]]
+
+                # A cell can neighbour more than one of the frontier: keep one of each, without sorting them. They
+                # haven't got a distance yet, so that's where their position in the list gets noted meanwhile.
+                order = numpy.arange(len(neighbours), dtype = numpy.int32)
+                self.distances[neighbours] = order
+                neighbours = neighbours[self.distances[neighbours] == order]
+                self.open[neighbours] = False
+                self.distance += 1
+                self.distances[neighbours] = self.distance
+                self.frontier = neighbours
+            return True
+
+    def __init__(self, budget = None, clock = time.perf_counter):
+        self._budget = budget
+        self._clock = clock
+
+        # The distance field, what it was computed for (the space and where the edible was) and from which tick.
+        self._field = None
+        self._field_key = None
+        self._field_tick = None
+
+        # The way to the edible the field showed last time, and when that was.
+        self._path = None
+        self._path_tick = None
+
+        # The space and score we last ate something with, and from which tick.
+        self._scored = None
+        self._scored_tick = None
+
+        self._decisions = 0
+        self._fallbacks = 0
+        self._computed = 0
+
+    def __call__(self, engine, rng = None):
+        """
+        So that it can be used as a GameHarness policy.
+        """
+        return self.decide(engine)
+
+    def decide(self, engine):
+        deadline = self._clock() + self._budget if self._budget is not None else None
+        self._decisions += 1
+
+        kinds = engine.space.kinds
+        head, tail, edible = engine.head, engine.tail, engine.edible
+        current = engine.direction
+
+        info = engine.info()
+        scored = (id(engine.space), info["score"])
+        if scored != self._scored:
+            self._scored, self._scored_tick = scored, info["ticks"]
+        restless = info["ticks"] - self._scored_tick > kinds.size * 2
+
+        # Anywhere we can go without dying on the spot. That rules out the tail too: it only moves after the head.
+        moves = []
+        for direction, (dx, dy) in enumerate(Snake.VECTORS):
+            if not SnakeEngine.is_movement_valid(current, direction):
+                continue
+            x, y = head[0] + dx, head[1] + dy
+            if not (0 <= x < kinds.shape[0] and 0 <= y < kinds.shape[1]) or kinds[x, y] == Element.SNAKE:
+                continue
+            moves.append((direction, (x, y)))
+
+        if not moves:
+            return current
+
+        # Closest to the edible first, as the crow flies, in case we run out of time.
+        moves.sort(key = lambda move: abs(move[1][0] - edible[0]) + abs(move[1][1] - edible[1]))
+
+        field = self._distances(engine, kinds, edible, moves, deadline)
+        if field is None:
+            self._fallbacks += 1
+            return moves[0][0]
+
+        # Cells the field can't reach go last, in the same order as before.
+        unreachable = kinds.size
+        moves.sort(key = lambda move: field[move[1]] if field[move[1]] >= 0 else unreachable)
+        if restless:
+            return moves[0][0]
+
+        for direction, cell in moves:
+            safe = self._reaches_tail(kinds, cell, tail, deadline)
+            if safe is None:
+                self._fallbacks += 1
+                return moves[0][0]
+            if safe:
+                return direction
+
+        # Locked in whichever way we go. Might as well head for the edible.
+        return moves[0][0]
+
+    def stats(self):
+        return {
+            "decisions": self._decisions,
+            "fallbacks": self._fallbacks,
+            "computed": self._computed,
+        }
+
+    def _distances(self, engine, kinds, edible, moves, deadline):
+        """
+        The distance field to the edible. It's computed again if the edible moved, and, at most once a tick, if the
+        current one has gone stale (see `_stale`). None if it isn't ready yet.
+        """
+        key = (id(engine.space), edible)
+        ticks = engine.info()["ticks"]
+        field = self._field
+
+        stale = field is None or self._field_key != key
+        if not stale and field.done and self._field_tick != ticks:
+            stale = self._stale(field, kinds, moves, ticks)
+
+        if stale:
+            field = self._field = Autopilot.Wavefront(kinds != Element.SNAKE, edible)
+            self._field_key, self._field_tick = key, ticks
+            self._path = None
+            self._computed += 1
+
+        if not field.done and not field.expand(deadline = deadline, clock = self._clock):
+            return None
+        return field
+
+    def _stale(self, field, kinds, moves, ticks):
+        """
+        Whether the field no longer leads anywhere, leads through the snake, or led nowhere closer since the last
+        tick. Keeps track of the way it shows to the edible meanwhile.
+        """
+        reached = [cell for _, cell in moves if field[cell] >= 0]
+        if not reached:
+            return True
+        best = min(reached, key = lambda cell: field[cell])
+
+        # Took the step it showed last tick: the rest of that way is still a shortest one. Otherwise, the field
+        # didn't get us any closer, and it's probably what we've been going round in circles on.
+        path = self._path
+        following = path is not None and self._path_tick == ticks - 1 and len(path) > 1 and path[1] == field.index(best)
+        if path is not None and self._path_tick == ticks - 1 and not following and field[best] >= len(path) - 1:
+            return True
+
+        path = path[1:] if following else field.path(best)
+        self._path, self._path_tick = path, ticks
+
+        # Whatever the snake moved into since doesn't get out of the way by itself.
+        return bool((kinds[field.cells(path)] == Element.SNAKE).any())
+
+    def _reaches_tail(self, kinds, cell, tail, deadline):
+        """
+        Whether there's still a way from the cell to the tail, with the head on the cell. None if there wasn't
+        time to find out.
+        """
+        passable = kinds != Element.SNAKE
+        passable[tail] = True
+        wavefront = Autopilot.Wavefront(passable, cell)
+        if not wavefront.expand(tail, deadline, self._clock):
+            return None
+        return wavefront[tail] >= 0
+
+# ----------------------------------------------------
+def _play_games(policy, seeds, max_ticks, dimensions, quantum, border_width):
+    """
+    Worker side of GameHarness: plays a game per seed, one after the other, and sends back the lot in one go.
+    """
+    results = numpy.zeros(len(seeds), dtype = GameHarness.RESULT)
+    engine = SnakeEngine(dimensions, quantum, border_width, seed = 0)
+    for i, seed in enumerate(seeds.tolist()):
+        engine.reset(seed)
+
+        # The policy gets randomness of its own, so that games play out the same whoever plays them.
+        rng = random.Random(~seed)
+        done = False
+        while not done and (max_ticks is None or engine.info()["ticks"] < max_ticks):
+            _, _, done, info = engine.step(policy(engine, rng) if policy is not None else None)
+
+        info = engine.info()
+        cause = info["cause"]
+        results[i] = (seed, info["score"], info["length"], info["ticks"],
+                      BatchedSnakeEngine.CAUSES.index(type(cause)) if cause is not None else BatchedSnakeEngine.ALIVE)
+    return results
+
+
+class GameHarness():
+    """
+    Plays lots of headless games, spread over as many processes as there are cores.
+
+    Games are handed out in batches of `batch` seeds, and come back as a numpy array of RESULT records, one per game:
+    seed, final score, length, ticks and what ended it (one of the causes of BatchedSnakeEngine, ALIVE meaning it
+    ran out of ticks). That's a few bytes per game to pickle, rather than a dictionary and an exception.
+
+    The policy is called as policy(engine, rng) before every tick, and returns the direction to take (or None to
+    carry on). It has to be picklable, so a function defined at the top of a module. No policy means going straight
+    until hitting something.
+    """
+    RESULT = numpy.dtype([("seed", numpy.int64), ("score", numpy.int32), ("length", numpy.int32),
+                          ("ticks", numpy.int64), ("cause", numpy.uint8)])
+
+    def __init__(self, policy = None, dimensions = SPACE_DIMENSIONS, quantum = SPACE_QUANTUM, border_width = SPACE_BORDER_WIDTH,
+                 workers = None, batch = 1000, max_ticks = None):
+        self._policy = policy
+        self._geometry = (dimensions, quantum, border_width)
+        self._workers = workers or os.cpu_count() or 1
+        self._batch = batch
+        self._max_ticks = max_ticks
+        self.elapsed = None
+
+    @staticmethod
+    def random_policy(engine, rng):
+        """
+        Turns at random every now and then. Good enough to fuzz the rules with.
+        """
+        if rng.random() < 0.25:
+            return rng.randrange(4)
+        return None
+
+    def seeds(self, games, seed = None):
+        """
+        The seed of every game. The same seed gives the same games, however many workers play them.
+        """
+        entropy = seed if seed is not None else random.getrandbits(63)
+        return (numpy.random.SeedSequence(entropy).generate_state(games, dtype = numpy.uint64) >> 1).astype(numpy.int64)
+
+    def run(self, games, seed = None):
+        """
+        Plays that many games, returning their results in the order of their seeds.
+        """
+        seeds = self.seeds(games, seed)
+        batches = [seeds[i:i + self._batch] for i in range(0, games, self._batch)]
+        start = time.perf_counter()
+
+        if self._workers == 1:
+            results = [_play_games(self._policy, batch, self._max_ticks, *self._geometry) for batch in batches]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(self._workers) as executor:
+                futures = [executor.submit(_play_games, self._policy, batch, self._max_ticks, *self._geometry) for batch in batches]
+                results = [future.result() for future in futures]
+
+        self.elapsed = time.perf_counter() - start
+        return numpy.concatenate(results) if results else numpy.zeros(0, dtype = GameHarness.RESULT)
+
+    @staticmethod
+    def summary(results):
+        """
+        Sums the results up: how many games, how they went on average and at the extremes, and what ended them.
+        """
+        summary = {"games": len(results)}
+        if not len(results):
+            return summary
+
+        for field in ("score", "length", "ticks"):
+            values = results[field]
+            p50, p90, p99 = numpy.percentile(values, (50, 90, 99)).tolist()
+            summary[field] = {"mean": float(values.mean()), "std": float(values.std()), "min": int(values.min()),
+                              "p50": p50, "p90": p90, "p99": p99, "max": int(values.max())}
+
+        counts = numpy.bincount(results["cause"], minlength = len(BatchedSnakeEngine.CAUSES)).tolist()
+        summary["causes"] = {(cause.__name__ if cause is not None else "timeout"): count
+                             for cause, count in zip(BatchedSnakeEngine.CAUSES, counts)}
+        return summary
+
+# ----------------------------------------------------
+class Scheduler():
+    """
+    Keeps the game ticking at a steady pace, however long drawing takes, and draws at a pace of its own.
+
+    Ticks follow a fixed time step: elapsed time piles up, and is paid back a tick at a time. Never more than
+    `max_catch_up` ticks at once though: past that, the game gives up on the time lost rather than fast forwarding.
+    Each renderer gets called at its own rate, skipping whichever frames it's too late for.
+    """
+    class Renderer():
+        __slots__ = ("render", "period", "due", "skipped")
+
+        def __init__(self, render, period, due):
+            self.render = render
+            self.period = period
+            self.due = due
+            self.skipped = 0
+
+    def __init__(self, tick_rate, max_catch_up = 5, clock = time.perf_counter):
+        self._clock = clock
+        self._period = 1.0 / tick_rate
+        self._max_catch_up = max_catch_up
+        self._accumulator = 0.0
+        self._last = clock()
+        self._renderers = []
+        self._dropped_ticks = 0
+
+    def add_renderer(self, render, rate):
+        self._renderers.append(Scheduler.Renderer(render, 1.0 / rate, self._clock()))
+
+    def ticks_due(self):
+        """
+        How many ticks the game should go through now to keep up.
+        """
+        now = self._clock()
+        self._accumulator += now - self._last
+        self._last = now
+
+        ticks = int(self._accumulator // self._period)
+        self._accumulator -= ticks * self._period
+        if ticks > self._max_catch_up:
+            self._dropped_ticks += ticks - self._max_catch_up
+            ticks = self._max_catch_up
+        return ticks
+
+    def render(self, *args):
+        """
+        Calls whichever renderers are due, with the arguments given. Returns how many were.
+        """
+        now = self._clock()
+        rendered = 0
+        for renderer in self._renderers:
+            if now < renderer.due:
+                continue
+
+            renderer.render(*args)
+            rendered += 1
+            renderer.due += renderer.period
+
+            # Too late for some frames already: let them go.
+            if renderer.due <= now:
+                missed = int((now - renderer.due) // renderer.period) + 1
+                renderer.skipped += missed
+                renderer.due += missed * renderer.period
+        return rendered
+
+    def time_to_next(self):
+        """
+        Seconds left until either a tick or a renderer is due.
+        """
+        now = self._clock()
+        wait = self._period - self._accumulator - (now - self._last)
+        for renderer in self._renderers:
+            wait = min(wait, renderer.due - now)
+        return max(0.0, wait)
+
+    def stats(self):
+        return {
+            "dropped_ticks": self._dropped_ticks,
+            "skipped_frames": [renderer.skipped for renderer in self._renderers],
+        }
+
+# ----------------------------------------------------
+class TickStats():
+    """
+    How long each phase of a tick takes, so we know who to blame when the game stutters.
+
+    Timings go into fixed histograms, one per phase, with a bucket per power of two microseconds: bucket 0 holds
+    anything under 1us, bucket i anything from 2^(i-1) up to 2^i us, and the last one anything longer. Recording is
+    just a couple of additions, and games without stats don't even get to do that.
+
+    Ticks taking longer than `budget` seconds count as missed. SnakeGame sets it to its tick period, unless told
+    otherwise. Every `interval` seconds, `report` prints a summary line, or dumps everything to `path` as JSON if
+    given one.
+    """
+    BUCKETS = 24
+
+    def __init__(self, budget = None, path = None, interval = 10.0, clock = time.perf_counter):
+        self._budget = budget
+        self._path = path
+        self._interval = interval
+        self._clock = clock
+        self._next_report = clock() + interval
+
+        self._histograms = {}
+        self._totals = {}
+        self._ticks = 0
+        self._missed = 0
+        self._dropped = 0
+
+    @property
+    def budget(self):
+        return self._budget
+
+    @budget.setter
+    def budget(self, budget):
+        self._budget = budget
+
+    def record(self, phase, seconds):
+        histogram = self._histograms.get(phase)
+        if histogram is None:
+            histogram = self._histograms[phase] = [0] * TickStats.BUCKETS
+            self._totals[phase] = 0.0
+        histogram[min(int(seconds * 1e6).bit_length(), TickStats.BUCKETS - 1)] += 1
+        self._totals[phase] += seconds
+
+    def tick(self, seconds):
+        """
+        Records a whole tick, which is missed if it took longer than the time it had.
+        """
+        self.record("tick", seconds)
+        self._ticks += 1
+        if self._budget is not None and seconds > self._budget:
+            self._missed += 1
+
+    def timed(self, phase, function):
+        """
+        Wraps the function, so that every call gets recorded under the given phase.
+        """
+        def timed(*args, **kwargs):
+            start = self._clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(phase, self._clock() - start)
+        return timed
+
+    def percentile(self, phase, p):
+        """
+        An upper bound, in seconds, for the given percentile (0 to 1) of the phase.
+        """
+        histogram = self._histograms.get(phase)
+        if not histogram:
+            return 0.0
+
+        target = p * sum(histogram)
+        count = 0
+        for bucket, hits in enumerate(histogram):
+            count += hits
+            if hits and count >= target:
+                return (1 << bucket) / 1e6
+        return (1 << (TickStats.BUCKETS - 1)) / 1e6
+
+    def to_dict(self):
+        return {
+            "ticks": self._ticks,
+            "missed": self._missed,
+            "dropped": self._dropped,
+            "budget": self._budget,
+            "phases": {
+                phase: {
+                    "count": sum(histogram),
+                    "total": self._totals[phase],
+                    "histogram": histogram,
+                } for phase, histogram in self._histograms.items()
+            },
+        }
+
+    def summary(self):
+        phases = " | ".join("{} p50 {:.3f}ms p99 {:.3f}ms".format(phase, self.percentile(phase, 0.5) * 1e3, self.percentile(phase, 0.99) * 1e3)
+                            for phase in self._histograms)
+        return "ticks {} missed {} dropped {} | {}".format(self._ticks, self._missed, self._dropped, phases)
+
+    def report(self, dropped = None, force = False):
+        """
+        Reports, if it's time to. `dropped` is how many ticks the scheduler had to give up on so far.
+        """
+        if dropped is not None:
+            self._dropped = dropped
+
+        now = self._clock()
+        if not force and now < self._next_report:
+            return
+        self._next_report = now + self._interval
+
+        if self._path is not None:
+            import json
+            with open(self._path, "w") as f:
+                json.dump(self.to_dict(), f)
+        else:
+            print(self.summary())
+
+# ----------------------------------------------------
+class PygameInput():
+    """
+    Keys (and the window closing) through pygame's events. The game's way to wait between ticks, too: waiting on
+    the next event means key presses get picked up right away.
+    """
+    def __init__(self):
+        import pygame
+        pygame.init()
+
+    def poll(self, game):
+        import pygame
+        for event in pygame.event.get():
+            self._handle_event(game, event)
+
+    def wait(self, game, timeout):
+        import pygame
+        event = pygame.event.wait(max(1, int(timeout * 1000)))
+        if event.type != pygame.NOEVENT:
+            self._handle_event(game, event)
 
     def close(self):
-        self._sock.close()    
+        import pygame
+        pygame.quit()
+
+    def _handle_event(self, game, event):
+        import pygame
+
+        # Hardcore ciao event
+        if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key in (pygame.K_q, pygame.K_ESCAPE)):
+            game.stop()
 
+        # Whatever was on the screen might be gone.
+        elif event.type in (pygame.VIDEORESIZE, pygame.VIDEOEXPOSE):
+            game.invalidate()
+
+        elif event.type == pygame.KEYDOWN:
+            direction = self._parse_key_press(event.key)
+            if direction is not None:
+                game.press(direction)
+
+    def _parse_key_press(self, pygame_key):
+        import pygame
+        if pygame_key == pygame.K_LEFT:
+            return KeyPress.LEFT
+        elif pygame_key == pygame.K_UP:
+            return KeyPress.UP
+        elif pygame_key == pygame.K_RIGHT:
+            return KeyPress.RIGHT
+        elif pygame_key == pygame.K_DOWN:
+            return KeyPress.DOWN
+        else:
+            return None
+
+
+class TerminalInput():
+    """
+    Keys straight from the terminal, which is switched to reading them as they come (and back, on close).
+    """
+    # Arrow keys, as terminals send them, and the usual letters for those without.
+    KEYS = {
+        b"\x1b[D": KeyPress.LEFT, b"\x1b[A": KeyPress.UP, b"\x1b[C": KeyPress.RIGHT, b"\x1b[B": KeyPress.DOWN,
+        b"a": KeyPress.LEFT, b"w": KeyPress.UP, b"d": KeyPress.RIGHT, b"s": KeyPress.DOWN,
+    }
+
+    def __init__(self, stream = None):
+        import tty
+        import termios
+        self._fd = (stream if stream is not None else sys.stdin).fileno()
+        self._settings = termios.tcgetattr(self._fd)
+        tty.setcbreak(self._fd)
+
+    def poll(self, game):
+        self.wait(game, 0)
+
+    def wait(self, game, timeout):
+        import select
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return
+
+        data = os.read(self._fd, 64)
+        if b"q" in data or data == b"\x1b":
+            game.stop()
+            return
+
+        # A read can hold several keys: arrows are three bytes long, letters one.
+        i = 0
+        while i < len(data):
+            length = 3 if data[i:i + 1] == b"\x1b" else 1
+            direction = TerminalInput.KEYS.get(data[i:i + length])
+            if direction is not None:
+                game.press(direction)
+            i += length
+
+    def close(self):
+        import termios
+        termios.tcsetattr(self._fd, termios.TCSADRAIN, self._settings)
+
+
+class NoInput():
+    """
+    Nobody at the keys: the game just waits for its next tick. Meant for an autopilot to play.
+    """
+    def poll(self, game):
+        pass
+
+    def wait(self, game, timeout):
+        time.sleep(timeout)
+
+    def close(self):
+        pass
 
 # ----------------------------------------------------
 class SnakeGame():
@@ -451,6 +3130,9 @@ class SnakeGame():
 
             # Space seems to be occupied, so it's either by the snake (game over) or by an edible
             if self._space.is_of_type(potential_position, Edible):
+                # Nowhere left for it to go, which means the snake is about to fill the whole space.
+                if self._space.free_count == 0:
+                    raise SpaceFilledGameOver("The snake has filled the whole space! Game Over!")
                 self._space[potential_position].set_position(self._space.get_random_unoccupied_position())
                 return True
 
@@ -462,65 +3144,109 @@ class SnakeGame():
         def free(self, position):
             self._space.free(position)
     
-    def __init__(self, ui):
+    def __init__(self, ui, tick_rate = 1000 / GAME_QUANTUM, fps = None, seed = None, record = None, stats = None, autopilot = None,
+                 engine = None, events = None):
+        # Where the timings go, if they go anywhere. Leave it to None and there'll be no timing at all.
+        self._stats = stats
+        if stats is not None and stats.budget is None:
+            stats.budget = 1.0 / tick_rate
+
+        # The game itself. We just feed it with directions and draw whatever comes out of it. Given an engine,
+        # it's up to whoever made it to have it recording (and timed) if need be.
+        if engine is None:
+            engine = SnakeEngine(seed = seed, record = record is not None, stats = stats)
+        self._engine = engine
+
+        # Where to save the replay of the game, if anywhere.
+        self._record = record
+
         # A snapshot of our snakey universe.
-        self._space = Space(SPACE_DIMENSIONS, SPACE_QUANTUM, SPACE_BORDER_WIDTH)
-        self._game = SnakeGame.Logic(self._space)
+        self._space = self._engine.space
 
-        # Movement
-        self._pressed_key = None
-        
-        # Snake expects a list of positions, even though the list is one.
-        self._direction = KeyPress(KeyPress.DOWN)
-        self._snake = Snake([[4, 0]], self._direction)
-        self._edible = Edible([1,0])
+        # Movement. Key presses wait in line for their tick, and get applied a turn per tick.
+        self._inputs = InputQueue()
+        self._direction = KeyPress.DOWN
 
-        # Engine specific code
-        pygame.init()
-        self._timer = pygame.time.Clock()
-        pygame.time.set_timer(GAME_QUANTUM_EVENT, GAME_QUANTUM)
+        # When the oldest press applied since the last frame happened, to tell how long it took to show.
+        self._unpresented = None
+
+        # Whatever steers the snake instead of the keyboard, if anything. See Autopilot.
+        self._autopilot = autopilot
+
+        # Where key presses come from: pygame's events, unless told otherwise (see TerminalInput and NoInput).
+        self._events = events if events is not None else PygameInput()
+        self._scheduler = Scheduler(tick_rate)
 
         # Indicate when to quit
         self._keep_running = True
-        self._ui = [ui]
+        self._ui = []
+        self.add_ui(ui, fps)
 
-        # Without a dummy driver, we can't control the screen! Booo!
-        # import os
-        # os.environ['SDL_VIDEODRIVER'] = 'dummy'
-        # pygame.display.set_mode((1,1))
-    
-    def add_ui(self, ui):
+    def press(self, direction):
         """
-        This is used to add support to different rendering mechanisms
+        A key got pressed. It's checked once its tick comes, against wherever the snake is heading by then.
+        """
+        self._inputs.push(direction, time.perf_counter())
+
+    def stop(self):
+        self._keep_running = False
+
+    def invalidate(self):
+        """
+        Whatever was on the screen might be gone: every UI gets to draw everything again.
+        """
+        for ui in self._ui:
+            if hasattr(ui, "invalidate"):
+                ui.invalidate()
+
+    def add_ui(self, ui, fps = None):
+        """
+        This is used to add support to different rendering mechanisms. Each of them gets drawn at its own rate, which
+        defaults to its FPS attribute (or SPACE_FPS, if it has none).
         """
         self._ui.append(ui)
 
+        # Spaces larger than the window get shown around the head of the snake.
+        if hasattr(ui, "follow"):
+            ui.follow(lambda: self._engine.head)
+
+        draw = ui.draw
+        if self._stats is not None:
+            draw = self._stats.timed("ui{}.{}".format(len(self._ui) - 1, type(ui).__name__), draw)
+        self._scheduler.add_renderer(draw, fps or getattr(ui, "FPS", SPACE_FPS))
+
+    def steer(self):
+        """
+        Lets the autopilot press the keys, if there's one. Its choice goes through the same checks as a key press.
+        """
+        if self._autopilot is None:
+            return
+
+        # It knows best: whatever the keyboard had to say goes.
+        self._inputs.clear()
+        self._inputs.push(self._autopilot(self._engine), time.perf_counter())
+
     def update_position(self):
-        current_direction = self._direction
-        proposed_direction = self._pressed_key
-
-        # Check if change of movement is valid
-        if proposed_direction is not None:
-            valid_movement = self._is_movement_valid(current_direction, proposed_direction)
-            if valid_movement:
-                self._direction.set(self._pressed_key)
-                print("+ direction:", str(proposed_direction))
-            else:
-                print ("Invalid direction passed: ", str(proposed_direction))
+        """
+        Applies the next valid turn waiting, if any. Returns when its key got pressed, or None.
+        """
+        turn = self._inputs.pop_turn(self._direction, self._is_movement_valid)
+        if turn is None:
+            return None
+
+        self._direction, pressed = turn
+        return pressed
 
     def update(self):
         """ 
         Updates the internal state of the game 
         """
-        try:
-            self._snake.update(self._game, self._direction)
-        except GameOver as e:
+        _, _, done, info = self._engine.step(self._direction)
+        if done:
             print ("You've died!")
-            print(e)
+            print(info["cause"])
             self._keep_running = False
 
-        self._edible.update(self._game)
-
     # ----------------- DRAWING BELOW
     def draw(self):
         """ 
@@ -545,58 +3271,204 @@ class SnakeGame():
         else:
             return True
 
-    def _parse_key_press(self, pygame_key):
-        if pygame_key == pygame.K_LEFT:
-            return KeyPress.LEFT
-        elif pygame_key == pygame.K_UP:
-            return KeyPress.UP
-        elif pygame_key == pygame.K_RIGHT:
-            return KeyPress.RIGHT
-        elif pygame_key == pygame.K_DOWN:
-            return KeyPress.DOWN
-        else:
-            return None
-
     def run(self):
         # First run:
-        print(self._direction)
-        
         self.update()
         self.draw()
 
-        while self._keep_running:
-            self._timer.tick(SPACE_FPS)
-
-            # Triggering the quit
-            for event in pygame.event.get():
-                # Hardcore ciao event
-                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_q):
-                    self._keep_running = False
-
-                # Tick
-                elif event.type == GAME_QUANTUM_EVENT:
-                    self.update_position()
-                    self.update()
-                    self.draw()
-
-                elif event.type == pygame.KEYDOWN:
-                    # Cache the previous movement in case the change is not valid.
-                    parsed_key = self._parse_key_press(event.key)
-                    if KeyPress.is_valid(parsed_key):
-                        self._pressed_key = KeyPress(parsed_key)
-                        
-                        current_direction = self._direction
-                        proposed_direction = self._pressed_key
-                        
-                        print("+ proposed direction:", str(proposed_direction))
-    
-                        
-        # Out of the loop.                    
-        pygame.quit()
+        stats = self._stats
+        clock = time.perf_counter
+
+        try:
+            while self._keep_running:
+                if stats is not None:
+                    start = clock()
+
+                # Triggering the quit
+                self._events.poll(self)
+
+                if stats is not None:
+                    stats.record("input", clock() - start)
+
+                # Tick, as many times as needed to keep up.
+                for _ in range(self._scheduler.ticks_due()):
+                    if not self._keep_running:
+                        break
+
+                    if stats is None:
+                        self.steer()
+                        self.update_position()
+                        self.update()
+                    else:
+                        start = clock()
+                        self.steer()
+                        pressed = self.update_position()
+                        positioned = clock()
+                        self.update()
+                        ticked = clock()
+                        stats.record("update_position", positioned - start)
+                        stats.tick(ticked - start)
+
+                        if pressed is not None:
+                            stats.record("input_to_tick", ticked - pressed)
+                            if self._unpresented is None:
+                                self._unpresented = pressed
+
+                rendered = self._scheduler.render(self._space)
+                if stats is not None and rendered and self._unpresented is not None:
+                    stats.record("input_to_present", clock() - self._unpresented)
+                    self._unpresented = None
+
+                if stats is not None:
+                    stats.report(self._scheduler.stats()["dropped_ticks"])
+
+                # Nothing to do until the next tick or frame, unless a key gets pressed meanwhile.
+                self._events.wait(self, self._scheduler.time_to_next())
+
+        finally:
+            # Out of the loop, however we got out of it: the terminal has to be left as it was found, for one.
+            self._events.close()
+
+        if stats is not None:
+            stats.report(self._scheduler.stats()["dropped_ticks"], force = True)
+
+        if self._record is not None:
+            self._engine.replay.save(self._record)
+
+# ----------------------------------------------------
+# The largest window the pygame backend opens, in pixels. Larger grids get shown around the head of the snake.
+WINDOW_MAX = 1000
+
+# Every backend the game can be played (or shown) with, by name. Each one only imports what it needs once picked,
+# so that e.g. a headless run never gets to load SDL.
+BACKENDS = ("pygame", "terminal", "aurabox", "spectator", "headless")
+
+# Headless games get this many ticks per cell of the space to end, by default. The Autopilot fills the space in less
+# than that, so games still going by then are going nowhere, and get counted as timeouts.
+HEADLESS_TICKS_PER_CELL = 200
+
+# The smallest grid games can be played on. The snake and the first edible always start at the same cells, up to the
+# fifth column.
+GRID_MIN = 5
+
+
+def _window(cells, cell, border_width):
+    return tuple(min(n * cell + border_width * 2, WINDOW_MAX) for n in cells)
+
+
+def _open_backend(name, args):
+    if name == "pygame":
+        return SnakeUI(_window(args.grid, args.cell, args.border), args.cell, args.border, blit = args.grid[0] * args.grid[1] > 10000)
+    elif name == "terminal":
+        # Not a terminal after all (e.g. piped to a file): whatever size they usually are, then.
+        return TerminalUI(size = None if sys.stdout.isatty() else (80, 24))
+    elif name == "aurabox":
+        return AuraboxUI(args.aurabox)
+    elif name == "spectator":
+        return SpectatorUI(port = args.port)
+
+
+def _parse_args(argv):
+    import argparse
+    parser = argparse.ArgumentParser(prog = "pysnakey", description = "Another clone of the snake-like game.")
+    parser.add_argument("--grid", type = int, nargs = 2, metavar = ("WIDTH", "HEIGHT"), default = [10, 10],
+                        help = "size of the space, in cells (default: 10 10)")
+    parser.add_argument("--cell", type = int, default = SPACE_QUANTUM, help = "size of a cell on screen, in pixels")
+    parser.add_argument("--border", type = int, default = SPACE_BORDER_WIDTH, help = "width of the border, in pixels")
+    parser.add_argument("--sparse", action = "store_true", help = "keep the space in chunks, for huge grids")
+    parser.add_argument("--tick-rate", type = float, default = 1000 / GAME_QUANTUM, help = "ticks per second")
+    parser.add_argument("--fps", type = float, default = None, help = "frames per second, for every backend")
+    parser.add_argument("--backend", action = "append", choices = BACKENDS, dest = "backends",
+                        help = "where the game goes, can be given more than once (default: pygame)")
+    parser.add_argument("--aurabox", metavar = "ADDRESS", help = "address of the Aurabox, for the aurabox backend")
+    parser.add_argument("--port", type = int, default = 7878, help = "port to serve spectators on")
+    parser.add_argument("--seed", type = int, default = None, help = "seed for the game, to play it again")
+    parser.add_argument("--autopilot", action = "store_true", help = "let the Autopilot play")
+    parser.add_argument("--record", metavar = "PATH", help = "save a replay of the game")
+    parser.add_argument("--stats", metavar = "PATH", nargs = "?", const = "", default = None,
+                        help = "time every tick, printing a summary or dumping it all to PATH as JSON")
+    parser.add_argument("--profile", metavar = "PATH", help = "profile the run, dumping the stats to PATH")
+    parser.add_argument("--games", type = int, default = 1000, help = "games to play, headless")
+    parser.add_argument("--workers", type = int, default = None, help = "processes to play them with, headless")
+    parser.add_argument("--max-ticks", type = int, default = None,
+                        help = "ticks before giving up on a game, headless (default: {} per cell)".format(HEADLESS_TICKS_PER_CELL))
+    args = parser.parse_args(argv)
+
+    args.backends = args.backends or ["pygame"]
+    if min(args.grid) < GRID_MIN:
+        parser.error("the grid has to be at least {0}x{0} cells".format(GRID_MIN))
+    if args.max_ticks is None:
+        args.max_ticks = HEADLESS_TICKS_PER_CELL * args.grid[0] * args.grid[1]
+    if "headless" in args.backends and len(args.backends) > 1:
+        parser.error("the headless backend can't be combined with others")
+    if "aurabox" in args.backends and args.aurabox is None:
+        parser.error("the aurabox backend needs --aurabox ADDRESS")
+    if args.sparse and args.autopilot:
+        parser.error("the autopilot reads the whole space, so it doesn't go with --sparse")
+    if args.sparse and "spectator" in args.backends:
+        parser.error("spectators get sent the whole space, so they don't go with --sparse")
+    if args.sparse and "headless" in args.backends:
+        parser.error("headless games are played on dense spaces")
+    return args
+
+
+def _play_headless(args):
+    import json
+    dimensions = tuple(n * args.cell + args.border * 2 for n in args.grid)
+    harness = GameHarness(Autopilot() if args.autopilot else GameHarness.random_policy, dimensions, args.cell, args.border,
+                          workers = args.workers, max_ticks = args.max_ticks)
+    summary = GameHarness.summary(harness.run(args.games, args.seed))
+    summary["elapsed"] = harness.elapsed
+    print(json.dumps(summary, indent = 2))
+
+
+def _play(args):
+    stats = TickStats(path = args.stats or None) if args.stats is not None else None
+    dimensions = tuple(n * args.cell + args.border * 2 for n in args.grid)
+    engine = SnakeEngine(dimensions, args.cell, args.border, seed = args.seed, record = args.record is not None, stats = stats,
+                         space_type = SparseSpace if args.sparse else Space)
+
+    # Keys come from the window if there's one, or else from the terminal, if there's one of those.
+    if "pygame" in args.backends:
+        events = PygameInput()
+    elif "terminal" in args.backends and sys.stdin.isatty():
+        events = TerminalInput()
+    else:
+        events = NoInput()
+
+    uis = [_open_backend(name, args) for name in args.backends]
+    game = SnakeGame(uis[0], args.tick_rate, args.fps, record = args.record, stats = stats,
+                     autopilot = Autopilot(budget = 0.5 / args.tick_rate) if args.autopilot else None, engine = engine, events = events)
+    for ui in uis[1:]:
+        game.add_ui(ui, args.fps)
+
+    try:
+        game.run()
+    finally:
+        for ui in uis:
+            if hasattr(ui, "close"):
+                ui.close()
+
+
+def main(argv = None):
+    """
+    Plays the game as told by the command line (see --help). Nothing but numpy gets loaded until a backend is picked.
+    """
+    args = _parse_args(argv)
+    play = _play_headless if args.backends == ["headless"] else _play
+
+    if args.profile is None:
+        play(args)
+        return 0
+
+    import cProfile
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(play, args)
+    finally:
+        profile.dump_stats(args.profile)
+    return 0
 
 # ----------------------------------------------------
 if __name__ == "__main__":
-    # aura_ui = AuraboxUI("11:75:58:92:3E:FF")
-    game = SnakeGame(SnakeUI())
-    # game.add_ui(aura_ui)
-    game.run()
\ No newline at end of file
+    sys.exit(main())